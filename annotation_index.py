@@ -0,0 +1,158 @@
+import os
+
+import numpy as np
+
+from utils import parse_annotation_files
+
+INDEX_VERSION = 1
+MISSING = np.iinfo(np.int64).min
+COORDINATES = ('xmin', 'ymin', 'xmax', 'ymax')
+
+
+def default_index_path(ann_dir):
+    return os.path.normpath(ann_dir) + '.index.npz'
+
+
+class AnnotationIndex:
+    # Columnar copy of a VOC annotation folder stored next to it in one .npz: one row per xml file
+    # (file, mtime, size, image filename, width, height) and one row per box (class, xmin, ymin, xmax, ymax).
+    # refresh only re-parses the xml files whose mtime or size changed since the index was written.
+
+    def __init__(self, ann_dir, index_path=None):
+        self.ann_dir = ann_dir
+        self.index_path = index_path if index_path is not None else default_index_path(ann_dir)
+        self.__columns = self.__load()
+
+    def __len__(self):
+        return len(self.__columns['files'])
+
+    def refresh(self, workers=1, chunksize=64):
+        # Returns the number of re-parsed files
+        files = sorted(os.listdir(self.ann_dir))
+        stats = [os.stat(os.path.join(self.ann_dir, file)) for file in files]
+        known = {file: idx for idx, file in enumerate(self.__columns['files'].tolist())}
+
+        stale = [file for file, stat in zip(files, stats) if not self.__is_current(known.get(file), stat)]
+
+        if not stale and len(files) == len(known):
+            return 0
+
+        # Every named object is kept, the labels filter is applied in records
+        results = parse_annotation_files([os.path.join(self.ann_dir, file) for file in stale], '', (),
+                                         workers=workers, chunksize=chunksize)
+        parsed = dict(zip(stale, (img for img, _ in results)))
+
+        rows = []
+        for file, stat in zip(files, stats):
+            if file in parsed:
+                rows.append(self.__row_from_record(file, stat, parsed[file]))
+            else:
+                rows.append(self.__row_from_index(known[file]))
+
+        self.__columns = self.__build(rows)
+        self.save()
+
+        return len(stale)
+
+    def save(self):
+        tmp_path = self.index_path + '.tmp'
+
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, version=INDEX_VERSION, **self.__columns)
+        os.replace(tmp_path, self.index_path)
+
+    def records(self, img_dir, labels):
+        # Same records as parse_annotation: images with at least one object whose name is in labels
+        columns = self.__columns
+        classes = columns['classes'].tolist()
+        keep = np.isin(columns['classes'], list(labels))[columns['box_classes']]
+        names = [classes[class_id] for class_id in columns['box_classes'].tolist()]
+        boxes = columns['boxes'].tolist()
+        offsets = columns['offsets'].tolist()
+
+        all_imgs = []
+
+        for idx, (filename, width, height) in enumerate(zip(columns['filenames'].tolist(),
+                                                             columns['widths'].tolist(),
+                                                             columns['heights'].tolist())):
+            start, end = offsets[idx], offsets[idx + 1]
+            objects = [self.__object(names[box], boxes[box]) for box in range(start, end) if keep[box]]
+
+            if len(objects) == 0:
+                continue
+
+            img = {"object": objects}
+            if filename != '':
+                img["filename"] = os.path.join(img_dir, filename)
+            if width >= 0:
+                img["width"] = width
+            if height >= 0:
+                img["height"] = height
+
+            all_imgs.append(img)
+
+        return all_imgs
+
+    def seen_labels(self):
+        # Object counts per name, in order of first appearance like parse_annotation
+        columns = self.__columns
+        class_ids, first, counts = np.unique(columns['box_classes'], return_index=True, return_counts=True)
+
+        return {str(columns['classes'][class_ids[i]]): int(counts[i]) for i in np.argsort(first)}
+
+    @staticmethod
+    def __object(name, box):
+        obj = {"name": name}
+        obj.update((key, value) for key, value in zip(COORDINATES, box) if value != MISSING)
+        return obj
+
+    def __is_current(self, idx, stat):
+        return idx is not None and \
+            int(self.__columns['mtimes'][idx]) == stat.st_mtime_ns and \
+            int(self.__columns['sizes'][idx]) == stat.st_size
+
+    @staticmethod
+    def __row_from_record(file, stat, img):
+        names = [obj["name"] for obj in img["object"]]
+        boxes = [[obj.get(key, MISSING) for key in COORDINATES] for obj in img["object"]]
+
+        return (file, stat.st_mtime_ns, stat.st_size, img.get("filename", ''),
+                img.get("width", -1), img.get("height", -1), names, boxes)
+
+    def __row_from_index(self, idx):
+        columns = self.__columns
+        start, end = columns['offsets'][idx], columns['offsets'][idx + 1]
+        names = columns['classes'][columns['box_classes'][start:end]].tolist()
+
+        return (columns['files'][idx], columns['mtimes'][idx], columns['sizes'][idx], columns['filenames'][idx],
+                columns['widths'][idx], columns['heights'][idx], names, columns['boxes'][start:end])
+
+    @staticmethod
+    def __build(rows):
+        files, mtimes, sizes, filenames, widths, heights, names, boxes = zip(*rows) if rows else ([],) * 8
+
+        counts = [len(file_names) for file_names in names]
+        all_names = [name for file_names in names for name in file_names]
+        classes, box_classes = np.unique(np.array(all_names, dtype=str), return_inverse=True)
+
+        return {'files': np.array(files, dtype=str),
+                'mtimes': np.array(mtimes, dtype=np.int64),
+                'sizes': np.array(sizes, dtype=np.int64),
+                'filenames': np.array(filenames, dtype=str),
+                'widths': np.array(widths, dtype=np.int64),
+                'heights': np.array(heights, dtype=np.int64),
+                'offsets': np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]).astype(np.int64),
+                'classes': classes,
+                'box_classes': box_classes.astype(np.int32).reshape(-1),
+                'boxes': np.concatenate([np.reshape(np.asarray(file_boxes, dtype=np.int64), (-1, 4))
+                                         for file_boxes in boxes] or [np.zeros((0, 4), dtype=np.int64)])}
+
+    def __load(self):
+        try:
+            with np.load(self.index_path) as index:
+                if int(index['version']) == INDEX_VERSION:
+                    return {key: index[key] for key in index.files if key != 'version'}
+        except (OSError, ValueError, KeyError):
+            pass
+
+        return self.__build([])
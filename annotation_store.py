@@ -0,0 +1,189 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from itertools import groupby
+
+from utils import write_annotation_xml
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS labels (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    session TEXT NOT NULL,
+    xml_name TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    saved_at REAL NOT NULL,
+    UNIQUE (session, xml_name)
+);
+CREATE TABLE IF NOT EXISTS boxes (
+    id INTEGER PRIMARY KEY,
+    image_id INTEGER NOT NULL REFERENCES images (id) ON DELETE CASCADE,
+    label_id INTEGER NOT NULL REFERENCES labels (id),
+    xmin INTEGER NOT NULL,
+    ymin INTEGER NOT NULL,
+    xmax INTEGER NOT NULL,
+    ymax INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS boxes_image_id ON boxes (image_id);
+'''
+
+
+class AnnotationStore:
+    # Every saved annotation of every session in one SQLite database (WAL journal) instead of one VOC xml per image.
+    # An image is keyed by its session folder and the xml name the xml backend would have written, saving it again
+    # replaces its boxes. Saves are buffered and committed batch_size at a time, or on flush. A failed commit keeps
+    # its annotations pending, the next put or flush commits them again.
+
+    def __init__(self, db_path, batch_size=64):
+        self.db_path = db_path
+        self.batch_size = batch_size
+
+        self.__lock = threading.Lock()
+        self.__pending = []
+        self.__labels = {}
+
+        self.__connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('PRAGMA synchronous=NORMAL')
+        self.__connection.execute('PRAGMA foreign_keys=ON')
+        self.__connection.executescript(SCHEMA)
+
+    def put(self, session, xml_name, filename, height, width, instances):
+        # Same annotation fields as write_annotation_xml. Returns True when this put committed every annotation put
+        # so far (a full batch), raises sqlite3.Error when that commit failed.
+        with self.__lock:
+            self.__pending.append((session, xml_name, filename, height, width, instances, time.time()))
+
+            if len(self.__pending) >= self.batch_size:
+                self.__commit()
+                return True
+
+            return False
+
+    @property
+    def pending_count(self):
+        with self.__lock:
+            return len(self.__pending)
+
+    def flush(self):
+        # Commits every annotation put so far, raises sqlite3.Error when that failed
+        with self.__lock:
+            self.__commit()
+
+    def close(self):
+        # Raises sqlite3.Error when the last commit failed, the connection is closed either way
+        with self.__lock:
+            try:
+                self.__commit()
+            finally:
+                self.__connection.close()
+
+    def sessions(self):
+        with self.__lock:
+            return [session for session, in self.__connection.execute('SELECT DISTINCT session FROM images ORDER BY session')]
+
+    def annotations(self, session=None):
+        # Yields (session, xml_name, annotation) in save order, annotation as taken by write_annotation_xml.
+        # Rows are streamed from one query, so exporting does not load the database into memory.
+        self.flush()
+
+        query = '''
+            SELECT images.id, images.session, images.xml_name, images.filename, images.width, images.height,
+                   labels.name, boxes.xmin, boxes.ymin, boxes.xmax, boxes.ymax
+            FROM images
+            LEFT JOIN boxes ON boxes.image_id = images.id
+            LEFT JOIN labels ON labels.id = boxes.label_id
+            {}
+            ORDER BY images.id, boxes.id
+        '''.format('WHERE images.session = ?' if session is not None else '')
+
+        # A separate connection reads a WAL snapshot while saves keep being committed
+        connection = sqlite3.connect(self.db_path)
+
+        try:
+            rows = connection.execute(query, (session,) if session is not None else ())
+
+            for _, image_rows in groupby(rows, key=lambda row: row[0]):
+                image_rows = list(image_rows)
+                _, image_session, xml_name, filename, width, height = image_rows[0][:6]
+                instances = [{'bbox': [xmin, ymin, xmax, ymax], 'category_id': name}
+                             for *_, name, xmin, ymin, xmax, ymax in image_rows if name is not None]
+
+                yield image_session, xml_name, {'filename': filename,
+                                                'height': height,
+                                                'width': width,
+                                                'instances': instances}
+        finally:
+            connection.close()
+
+    def export_voc(self, output_dir=None, session=None):
+        # Regenerates the VOC xml files, into output_dir or by default into each image's session folder.
+        # Returns the number of written files.
+        count = 0
+
+        for image_session, xml_name, annotation in self.annotations(session):
+            target_dir = output_dir if output_dir is not None else image_session
+            os.makedirs(target_dir, exist_ok=True)
+            write_annotation_xml(os.path.join(target_dir, xml_name), **annotation)
+            count += 1
+
+        return count
+
+    def __commit(self):
+        if len(self.__pending) == 0:
+            return
+
+        try:
+            with self.__connection:
+                self.__insert(self.__pending)
+        except sqlite3.Error:
+            # Label ids inserted by the rolled back transaction are gone, the annotations are kept for the next try
+            self.__labels.clear()
+            raise
+
+        self.__pending = []
+
+    def __insert(self, pending):
+        for session, xml_name, filename, height, width, instances, saved_at in pending:
+            self.__connection.execute('''
+                INSERT INTO images (session, xml_name, filename, width, height, saved_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (session, xml_name)
+                DO UPDATE SET filename = excluded.filename, width = excluded.width,
+                              height = excluded.height, saved_at = excluded.saved_at
+            ''', (session, xml_name, filename, width, height, saved_at))
+            image_id, = self.__connection.execute('SELECT id FROM images WHERE session = ? AND xml_name = ?',
+                                                  (session, xml_name)).fetchone()
+
+            self.__connection.execute('DELETE FROM boxes WHERE image_id = ?', (image_id,))
+            self.__connection.executemany(
+                'INSERT INTO boxes (image_id, label_id, xmin, ymin, xmax, ymax) VALUES (?, ?, ?, ?, ?, ?)',
+                [(image_id, self.__label_id(instance['category_id']), *instance['bbox']) for instance in instances])
+
+    def __label_id(self, name):
+        if name not in self.__labels:
+            self.__connection.execute('INSERT OR IGNORE INTO labels (name) VALUES (?)', (name,))
+            self.__labels[name], = self.__connection.execute('SELECT id FROM labels WHERE name = ?',
+                                                             (name,)).fetchone()
+
+        return self.__labels[name]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export an annotation database to VOC xml files')
+    parser.add_argument('db_path')
+    parser.add_argument('--output-dir', default=None,
+                        help='folder for every xml file, by default each session annotation folder')
+    parser.add_argument('--session', default=None, help='only export this session annotation folder')
+    args = parser.parse_args()
+
+    store = AnnotationStore(args.db_path)
+    print('Exported {} annotations'.format(store.export_voc(args.output_dir, args.session)))
+    store.close()
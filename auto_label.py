@@ -0,0 +1,184 @@
+import os
+os.environ["CUDA_VISIBLE_DEVICES"] = ''
+import argparse
+from functools import partial
+
+from tqdm import tqdm
+
+from frame_sampling import SAMPLING_STRATEGIES, extract_frames
+from labels import Label
+from inference_backend import BACKENDS, ensure_onnx
+from model_loader import ModelLoader
+from prediction_cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE, PredictionCache
+from utils import globWithTypes, map_bounded, predict_paths, write_annotation_xml
+
+DEFAULT_MODEL_PATH = './yolov2_ship_model.h5'
+IMAGE_TYPES = ['png', 'jpg', 'jpeg']
+VIDEO_TYPES = ('.mp4', '.avi')
+
+# The detector and the prediction cache of this worker process, set up once by init_worker
+_model_loader = None
+_cache = None
+
+
+def init_worker(model_path, backend='keras', threads=None, cache_dir=DEFAULT_CACHE_DIR):
+    global _model_loader, _cache
+
+    # The same cache as the labeling tool, which then shows these proposals without running the model again
+    _cache = PredictionCache(cache_dir, model_path, DEFAULT_CACHE_SIZE, backend=backend) \
+        if cache_dir is not None else None
+    # Loaded by the first batch that misses the cache, a resumed run whose proposals are all cached never loads it
+    _model_loader = ModelLoader(model_path, backend=backend, intraOpThreads=threads,
+                                interOpThreads=1 if threads is not None else None)
+
+
+def load_model():
+    return _model_loader.model
+
+
+def auto_label(input_path, annotation_dir=None, model_path=DEFAULT_MODEL_PATH, backend='keras', workers=1, batch_size=8,
+               threads=None, frame_ratio=0.05, frame_strategy='uniform', seed=0, overwrite=False,
+               cache_dir=DEFAULT_CACHE_DIR, **prediction_kwargs):
+    # Pre-labels an image folder, or the sampled frames of a video, with the detector and writes one VOC xml per
+    # image into annotation_dir (<folder>/annotation like a labeling session by default). Images that already have
+    # an xml are skipped, so an interrupted run picks up where it stopped. Proposals go through the prediction cache
+    # in cache_dir (None disables it). Returns (labeled, skipped, failed paths).
+    if os.path.splitext(input_path)[1].lower() in VIDEO_TYPES:
+        image_dir = extract_video_frames(input_path, frame_ratio, frame_strategy, seed)
+    else:
+        image_dir = input_path
+
+    if annotation_dir is None:
+        annotation_dir = os.path.join(image_dir, 'annotation')
+    os.makedirs(annotation_dir, exist_ok=True)
+
+    if backend == 'onnx':
+        # Converted here once rather than by every worker process at the same time
+        ensure_onnx(model_path)
+
+    image_paths = sorted(globWithTypes(image_dir, IMAGE_TYPES))
+    pending = [path for path in image_paths
+               if overwrite or not os.path.exists(annotation_path(annotation_dir, path))]
+    batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+
+    print('{} images, {} already labeled'.format(len(image_paths), len(image_paths) - len(pending)))
+
+    label = partial(label_batch, annotation_dir=annotation_dir, batch_size=batch_size, **prediction_kwargs)
+    labeled = 0
+    failed = []
+
+    with tqdm(total=len(pending), desc='Auto labeling') as pbar:
+        for batch_labeled, batch_failed in map_bounded(label, batches, workers=workers, initializer=init_worker,
+                                                       initargs=(model_path, backend, threads, cache_dir)):
+            labeled += batch_labeled
+            failed += batch_failed
+            pbar.update(batch_labeled + len(batch_failed))
+
+    for path, message in failed:
+        print('Failed {}: {}'.format(path, message))
+
+    return labeled, len(image_paths) - len(pending), [path for path, _ in failed]
+
+
+def extract_video_frames(video_path, ratio=0.05, strategy='uniform', seed=0):
+    # Frames go where a labeling session of the video puts them. The sampling is seeded, so a resumed run samples
+    # the same frames and only extracts the ones that are missing.
+    video_name = os.path.basename(video_path).split('.')[0]
+    frame_dir = os.path.join(os.path.dirname(video_path), video_name)
+    os.makedirs(frame_dir, exist_ok=True)
+
+    for _ in tqdm(extract_frames(video_path, frame_dir, ratio=ratio, strategy=strategy, seed=seed,
+                                 skip_existing=True), desc='Extract frames'):
+        pass
+
+    return frame_dir
+
+
+def annotation_path(annotation_dir, image_path):
+    # Named like the xml files saved by the labeling tool
+    return os.path.join(annotation_dir, os.path.basename(image_path).split('.')[0] + '.xml')
+
+
+def label_batch(image_paths, annotation_dir, batch_size=8, **prediction_kwargs):
+    # Runs in the worker processes. Returns (number of written xml files, [(image path, error message)]).
+    # A batch that fails (e.g. a grayscale image the model can not take) is retried image by image.
+    try:
+        proposals = predict_paths(image_paths, load_model, batch_size=batch_size, cache=_cache,
+                                  **prediction_kwargs)
+    except Exception as e:
+        if len(image_paths) == 1:
+            return 0, [(image_paths[0], str(e))]
+
+        labeled = 0
+        failed = []
+
+        for image_path in image_paths:
+            image_labeled, image_failed = label_batch([image_path], annotation_dir, 1, **prediction_kwargs)
+            labeled += image_labeled
+            failed += image_failed
+
+        return labeled, failed
+
+    for image_path, (boxes, (height, width)) in zip(image_paths, proposals):
+        write_annotation_xml(annotation_path(annotation_dir, image_path),
+                             filename=os.path.basename(image_path),
+                             height=height,
+                             width=width,
+                             instances=proposal_instances(boxes, height, width))
+
+    return len(image_paths), []
+
+
+def proposal_instances(boxes, height, width, label=Label.SHIP):
+    # (x, y, w, h) pixel boxes to write_annotation_xml instances, clipped like the labeling tool clips saved boxes
+    instances = []
+
+    for x, y, w, h in boxes:
+        xmin = max(0, min(x, width - 1))
+        ymin = max(0, min(y, height - 1))
+        xmax = max(0, min(x + w, width - 1))
+        ymax = max(0, min(y + h, height - 1))
+
+        if xmax > xmin and ymax > ymin:
+            instances.append({'bbox': [xmin, ymin, xmax, ymax], 'category_id': label.value})
+
+    return instances
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pre-label an image folder or a video with the detector, '
+                                                 'writing VOC xml files without the GUI')
+    parser.add_argument('input_path', help='image folder or .mp4/.avi video')
+    parser.add_argument('--annotation-dir', default=None, help='where the xml files go, <folder>/annotation by default')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--backend', choices=BACKENDS, default='keras',
+                        help='onnx runs the detector with ONNX Runtime, converting the .h5 model on first use')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes, each loads its own model')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=None, help='inference threads per worker process')
+    parser.add_argument('--frame-ratio', type=float, default=0.05, help='fraction of the video frames to label')
+    parser.add_argument('--frame-strategy', choices=SAMPLING_STRATEGIES, default='uniform')
+    parser.add_argument('--seed', type=int, default=0, help='frame sampling seed, keep it to resume a video')
+    parser.add_argument('--obj-threshold', type=float, default=0.3)
+    parser.add_argument('--nms-threshold', type=float, default=0.3)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help='prediction cache shared with the labeling tool')
+    parser.add_argument('--no-cache', action='store_true', help='do not read nor write the prediction cache')
+    parser.add_argument('--overwrite', action='store_true', help='label images that already have an xml again')
+    args = parser.parse_args()
+
+    labeled, skipped, failed = auto_label(args.input_path,
+                                          annotation_dir=args.annotation_dir,
+                                          model_path=args.model,
+                                          backend=args.backend,
+                                          workers=args.workers,
+                                          batch_size=args.batch_size,
+                                          threads=args.threads,
+                                          frame_ratio=args.frame_ratio,
+                                          frame_strategy=args.frame_strategy,
+                                          seed=args.seed,
+                                          overwrite=args.overwrite,
+                                          cache_dir=None if args.no_cache else args.cache_dir,
+                                          obj_threshold=args.obj_threshold,
+                                          nms_threshold=args.nms_threshold)
+    print('Labeled {}, skipped {}, failed {}'.format(labeled, skipped, len(failed)))
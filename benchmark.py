@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from labels import Label
+from nms import non_max_suppression
+from utils import ANCHORS, decode_netout, parse_annotation, predict_batch, preprocess_image, \
+    write_annotation_xml
+
+LABELS = [label.value for label in Label]
+STAGES = ('decode_netout', 'nms', 'preprocess', 'predict', 'parse_annotation', 'save_xml', 'frame_extraction')
+
+# Sizes per stage, the quick set is for a smoke run before committing
+SIZES = {
+    'decode_netout': [13, 26, 52],
+    'nms': [100, 1000, 4000],
+    'preprocess': [(640, 480), (1920, 1080), (3840, 2160)],
+    'predict': [1, 8, 32],
+    'parse_annotation': [100, 1000, 5000],
+    'save_xml': [100, 1000],
+    'frame_extraction': [300, 3000],
+}
+QUICK_SIZES = {
+    'decode_netout': [13],
+    'nms': [100],
+    'preprocess': [(640, 480)],
+    'predict': [1, 8],
+    'parse_annotation': [100],
+    'save_xml': [100],
+    'frame_extraction': [300],
+}
+
+
+class StubModel:
+    # Stands in for the Keras detector: predict returns seeded random netouts of the YOLOv2 output shape,
+    # so the preprocessing and decoding around model.predict can be timed without the .h5 model.
+
+    def __init__(self, grid_h=13, grid_w=13, box_num=5, nb_class=1, seed=0):
+        self.output_shape = (grid_h, grid_w, box_num, 4 + 1 + nb_class)
+        self.__random = np.random.RandomState(seed)
+
+    def predict(self, input_images):
+        return synthetic_netout(self.__random, len(input_images), self.output_shape)
+
+
+def synthetic_netout(random, batch_size, shape_dims, object_ratio=0.02):
+    # Background cells get a very low objectness, about object_ratio of the cells a high one, like a real netout
+    netout = random.normal(0, 1, (batch_size,) + tuple(shape_dims)).astype(np.float32)
+    netout[..., 4] = np.where(random.rand(*netout.shape[:-1]) < object_ratio, 4., -6.)
+    netout[..., 5:] = np.abs(netout[..., 5:]) + 2.
+
+    return netout
+
+
+def synthetic_boxes(random, count, image_size=1000, box_size=80):
+    xy = random.rand(count, 2) * image_size
+    wh = (0.5 + random.rand(count, 2)) * box_size
+
+    return np.concatenate([xy, xy + wh], axis=-1), random.rand(count)
+
+
+def synthetic_image(random, width, height):
+    return random.randint(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def synthetic_instances(random, count, width=1920, height=1080):
+    instances = []
+
+    for _ in range(count):
+        xmin, ymin = int(random.randint(0, width - 100)), int(random.randint(0, height - 100))
+        instances.append({'bbox': [xmin, ymin, xmin + int(random.randint(10, 100)), ymin + int(random.randint(10, 100))],
+                          'category_id': LABELS[random.randint(len(LABELS))]})
+
+    return instances
+
+
+def write_voc_folder(random, ann_dir, count, boxes_per_image=5):
+    os.makedirs(ann_dir, exist_ok=True)
+
+    for idx in range(count):
+        write_annotation_xml(os.path.join(ann_dir, '{:06d}.xml'.format(idx)), '{:06d}.jpg'.format(idx), 1080, 1920,
+                             synthetic_instances(random, random.randint(1, 2 * boxes_per_image)))
+
+
+def write_video(random, video_path, frame_count, width=640, height=360, fps=30):
+    import cv2
+
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    frame = synthetic_image(random, width, height)
+
+    try:
+        for idx in range(frame_count):
+            # Shifted noise so consecutive frames differ without generating a new image per frame
+            writer.write(np.roll(frame, idx, axis=1))
+    finally:
+        writer.release()
+
+
+def measure(function, repeat, setup=None):
+    # Wall time of repeat runs, setup (untimed) before every run returns the arguments of function
+    times = []
+
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+
+    return times
+
+
+def bench_decode_netout(random, grid, repeat):
+    shape_dims = (grid, grid, 5, 4 + 1 + 1)
+    netout = synthetic_netout(random, 1, shape_dims)[0]
+
+    return measure(lambda: decode_netout(netout, shape_dims, ANCHORS, nb_class=1), repeat)
+
+
+def bench_nms(random, count, repeat):
+    boxes, scores = synthetic_boxes(random, count)
+
+    return measure(lambda: non_max_suppression(boxes, scores, iou_threshold=0.3), repeat)
+
+
+def bench_preprocess(random, size, repeat):
+    image = synthetic_image(random, *size)
+
+    return measure(lambda: preprocess_image(image), repeat)
+
+
+def bench_predict(random, batch_size, repeat):
+    # Preprocessing, the stub model and batched decoding, i.e. everything of predict_batch but the real network
+    images = [synthetic_image(random, 1920, 1080) for _ in range(batch_size)]
+    model = StubModel()
+
+    return measure(lambda: predict_batch(images, model, batch_size=batch_size), repeat)
+
+
+def bench_parse_annotation(random, count, repeat, work_dir):
+    ann_dir = os.path.join(work_dir, 'annotation_{}'.format(count))
+    write_voc_folder(random, ann_dir, count)
+
+    return measure(lambda: parse_annotation(ann_dir, os.path.join(work_dir, 'image'), LABELS, 'benchmark'), repeat)
+
+
+def bench_save_xml(random, count, repeat, work_dir):
+    ann_dir = os.path.join(work_dir, 'save_{}'.format(count))
+    os.makedirs(ann_dir, exist_ok=True)
+    annotations = [synthetic_instances(random, random.randint(1, 10)) for _ in range(count)]
+
+    def save():
+        for idx, instances in enumerate(annotations):
+            write_annotation_xml(os.path.join(ann_dir, '{:06d}.xml'.format(idx)), '{:06d}.jpg'.format(idx), 1080,
+                                 1920, instances)
+
+    return measure(save, repeat)
+
+
+def bench_frame_extraction(random, frame_count, repeat, work_dir):
+    from frame_sampling import extract_frames
+
+    video_path = os.path.join(work_dir, 'video_{}.avi'.format(frame_count))
+    frame_dir = os.path.join(work_dir, 'frames_{}'.format(frame_count))
+    os.makedirs(frame_dir, exist_ok=True)
+    write_video(random, video_path, frame_count)
+
+    return measure(lambda: list(extract_frames(video_path, frame_dir, ratio=0.05, strategy='uniform')), repeat)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(stages=STAGES, sizes=None, repeat=5, seed=0):
+    # Returns one result dict per (stage, size), every stage gets the same seeded data on every run
+    sizes = SIZES if sizes is None else sizes
+    benchmarks = {
+        'decode_netout': bench_decode_netout,
+        'nms': bench_nms,
+        'preprocess': bench_preprocess,
+        'predict': bench_predict,
+        'parse_annotation': bench_parse_annotation,
+        'save_xml': bench_save_xml,
+        'frame_extraction': bench_frame_extraction,
+    }
+    results = []
+
+    with tempfile.TemporaryDirectory(prefix='labeling_benchmark_') as work_dir:
+        for stage in stages:
+            for size in sizes[stage]:
+                random = np.random.RandomState(seed)
+                args = (random, size, repeat, work_dir) if stage in ('parse_annotation', 'save_xml',
+                                                                     'frame_extraction') else (random, size, repeat)
+                times = benchmarks[stage](*args)
+
+                result = {'stage': stage,
+                          'size': list(size) if isinstance(size, tuple) else size,
+                          'repeat': repeat,
+                          'times': times,
+                          'min': min(times),
+                          'median': float(np.median(times)),
+                          'mean': float(np.mean(times))}
+                results.append(result)
+                print('{:<18} {:<14} median {:9.3f} ms  min {:9.3f} ms'.format(stage, str(result['size']),
+                                                                             result['median'] * 1000,
+                                                                             result['min'] * 1000))
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the detection, annotation and I/O stages on synthetic data')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--quick', action='store_true', help='only the smallest sizes')
+    parser.add_argument('--output', default='benchmark_results.json', help='json file with every timing')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.stages, QUICK_SIZES if args.quick else SIZES, args.repeat, args.seed)
+
+    with open(args.output, 'w') as f:
+        json.dump({'commit': git_commit(),
+                   'created': time.time(),
+                   'python': platform.python_version(),
+                   'numpy': np.__version__,
+                   'platform': platform.platform(),
+                   'cpu_count': os.cpu_count(),
+                   'repeat': args.repeat,
+                   'seed': args.seed,
+                   'results': results}, f, indent=2)
+
+    print('Results written to {}'.format(args.output))
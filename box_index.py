@@ -0,0 +1,46 @@
+from collections import defaultdict
+
+
+class BoxGridIndex:
+    # Uniform grid of cellSize pixel buckets over the viewer. Every box is listed in the buckets its rectangle
+    # touches, so a point lookup only has to test the few boxes of one bucket instead of every box.
+
+    def __init__(self, cellSize=64):
+        self.cellSize = cellSize
+        self.__cells = defaultdict(set)
+        self.__boxCells = {}
+
+    def __len__(self):
+        return len(self.__boxCells)
+
+    def insert(self, box, x, y, w, h):
+        # Also used to update a box that was moved or resized
+        self.remove(box)
+
+        cells = self.__cellsOf(x, y, w, h)
+        for cell in cells:
+            self.__cells[cell].add(box)
+
+        self.__boxCells[box] = cells
+
+    def remove(self, box):
+        for cell in self.__boxCells.pop(box, ()):
+            bucket = self.__cells[cell]
+            bucket.discard(box)
+
+            if not bucket:
+                del self.__cells[cell]
+
+    def query(self, x, y):
+        # Boxes whose bucket holds (x, y), a superset of the boxes containing the point
+        return self.__cells.get((x // self.cellSize, y // self.cellSize), ())
+
+    def clear(self):
+        self.__cells.clear()
+        self.__boxCells.clear()
+
+    def __cellsOf(self, x, y, w, h):
+        x0, y0 = x // self.cellSize, y // self.cellSize
+        x1, y1 = (x + max(w, 1) - 1) // self.cellSize, (y + max(h, 1) - 1) // self.cellSize
+
+        return [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
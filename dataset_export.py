@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+from functools import partial
+
+from tqdm import tqdm
+
+from labels import CLASS_IDS
+from utils import map_bounded, parse_filtered_annotation_file
+
+EXPORT_FORMATS = ('coco', 'yolo', 'tfrecord')
+
+
+def export_dataset(ann_dir, img_dir, output_dir, formats=EXPORT_FORMATS, workers=None, max_in_flight=None,
+                   shard_size=1000, min_size=1):
+    # One streaming pass over ann_dir. Worker processes parse each xml, write its YOLO txt file and build its
+    # TFRecord example; the main process appends to the COCO json and the TFRecord shards in sorted file order.
+    # Only max_in_flight files are in memory at a time. Returns the number of exported images.
+    unknown = set(formats) - set(EXPORT_FORMATS)
+    if unknown:
+        raise ValueError('export formats should be in {}, got {}'.format(EXPORT_FORMATS, sorted(unknown)))
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    yolo_dir = None
+    if 'yolo' in formats:
+        yolo_dir = os.path.join(output_dir, 'yolo')
+        os.makedirs(yolo_dir, exist_ok=True)
+
+        with open(os.path.join(output_dir, 'classes.txt'), 'w') as f:
+            f.write('\n'.join(sorted(CLASS_IDS, key=CLASS_IDS.get)) + '\n')
+
+    coco = CocoWriter(os.path.join(output_dir, 'annotations.json')) if 'coco' in formats else None
+    tfrecord = TFRecordShardWriter(os.path.join(output_dir, 'tfrecord', 'data'), shard_size) \
+        if 'tfrecord' in formats else None
+
+    ann_paths = (os.path.join(ann_dir, ann) for ann in sorted(os.listdir(ann_dir)))
+    convert = partial(export_annotation_file, img_dir=img_dir, min_size=min_size, yolo_dir=yolo_dir,
+                      tfrecord=tfrecord is not None)
+    count = 0
+
+    try:
+        for record, example in tqdm(map_bounded(convert, ann_paths, workers=workers, max_in_flight=max_in_flight),
+                                    desc='Export annotations'):
+            if record is None:
+                continue
+
+            count += 1
+
+            if coco is not None:
+                coco.add(record)
+            if tfrecord is not None:
+                tfrecord.write(example)
+    except BaseException:
+        # A partial json would still parse, so none is left behind
+        if coco is not None:
+            coco.abort()
+        raise
+    else:
+        if coco is not None:
+            coco.close()
+    finally:
+        if tfrecord is not None:
+            tfrecord.close()
+
+    return count
+
+
+def export_annotation_file(ann_path, img_dir, min_size=1, yolo_dir=None, tfrecord=False):
+    # Runs in the worker processes. Returns (record, serialized tf.train.Example or None), (None, None) when the
+    # file has no box of a known label. min_size >= 1 also drops boxes with missing coordinates.
+    record = parse_filtered_annotation_file(ann_path, img_dir, CLASS_IDS, min_size)
+
+    if record is None:
+        return None, None
+
+    if "width" not in record or "height" not in record:
+        from PIL import Image
+
+        with Image.open(record["filename"]) as image:
+            record["width"], record["height"] = image.size
+
+    if yolo_dir is not None:
+        # Named after the xml, which is unique in ann_dir, unlike image names without their extension
+        name = os.path.splitext(os.path.basename(ann_path))[0]
+        write_yolo_labels(os.path.join(yolo_dir, name + '.txt'), record)
+
+    return record, tf_example(record) if tfrecord else None
+
+
+def write_yolo_labels(path, record):
+    # One 'class_id x_center y_center width height' line per box, normalized by the image size
+    width, height = record["width"], record["height"]
+    lines = []
+
+    for obj in record["object"]:
+        lines.append('{} {:.6f} {:.6f} {:.6f} {:.6f}'.format(CLASS_IDS[obj["name"]],
+                                                            (obj["xmin"] + obj["xmax"]) / 2 / width,
+                                                            (obj["ymin"] + obj["ymax"]) / 2 / height,
+                                                            (obj["xmax"] - obj["xmin"]) / width,
+                                                            (obj["ymax"] - obj["ymin"]) / height))
+
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def tf_example(record):
+    # TensorFlow Object Detection API fields, class labels are 1-based there since 0 is the background
+    import tensorflow as tf
+
+    def int64_list(values):
+        return tf.train.Feature(int64_list=tf.train.Int64List(value=values))
+
+    def float_list(values):
+        return tf.train.Feature(float_list=tf.train.FloatList(value=values))
+
+    def bytes_list(values):
+        return tf.train.Feature(bytes_list=tf.train.BytesList(value=values))
+
+    with open(record["filename"], 'rb') as f:
+        encoded = f.read()
+
+    filename = os.path.basename(record["filename"]).encode()
+    image_format = os.path.splitext(record["filename"])[1][1:].lower().replace('jpg', 'jpeg').encode()
+    width, height = record["width"], record["height"]
+    objects = record["object"]
+
+    feature = {
+        'image/height': int64_list([height]),
+        'image/width': int64_list([width]),
+        'image/filename': bytes_list([filename]),
+        'image/source_id': bytes_list([filename]),
+        'image/encoded': bytes_list([encoded]),
+        'image/format': bytes_list([image_format]),
+        'image/object/bbox/xmin': float_list([obj["xmin"] / width for obj in objects]),
+        'image/object/bbox/xmax': float_list([obj["xmax"] / width for obj in objects]),
+        'image/object/bbox/ymin': float_list([obj["ymin"] / height for obj in objects]),
+        'image/object/bbox/ymax': float_list([obj["ymax"] / height for obj in objects]),
+        'image/object/class/text': bytes_list([obj["name"].encode() for obj in objects]),
+        'image/object/class/label': int64_list([CLASS_IDS[obj["name"]] + 1 for obj in objects]),
+    }
+
+    return tf.train.Example(features=tf.train.Features(feature=feature)).SerializeToString()
+
+
+class CocoWriter:
+    # COCO detection json written incrementally: images go straight into the file and annotations into a temporary
+    # file appended on close, so memory does not grow with the dataset. Category ids are the class ids + 1.
+    # Everything goes to a temporary file renamed to path by close, abort removes it instead.
+
+    def __init__(self, path):
+        self.path = path
+        self.__tmpPath = path + '.tmp'
+        self.__file = open(self.__tmpPath, 'w')
+        self.__annotations = tempfile.TemporaryFile('w+')
+        self.__imageId = 0
+        self.__annotationId = 0
+
+        self.__file.write('{"images": [')
+
+    def add(self, record):
+        self.__imageId += 1
+        image = {'id': self.__imageId,
+                 'file_name': os.path.basename(record["filename"]),
+                 'width': record["width"],
+                 'height': record["height"]}
+        self.__file.write((', ' if self.__imageId > 1 else '') + json.dumps(image))
+
+        for obj in record["object"]:
+            self.__annotationId += 1
+            width, height = obj["xmax"] - obj["xmin"], obj["ymax"] - obj["ymin"]
+            annotation = {'id': self.__annotationId,
+                          'image_id': self.__imageId,
+                          'category_id': CLASS_IDS[obj["name"]] + 1,
+                          'bbox': [obj["xmin"], obj["ymin"], width, height],
+                          'area': width * height,
+                          'iscrowd': 0}
+            self.__annotations.write((', ' if self.__annotationId > 1 else '') + json.dumps(annotation))
+
+    def close(self):
+        self.__file.write('], "annotations": [')
+        self.__annotations.seek(0)
+        shutil.copyfileobj(self.__annotations, self.__file)
+        self.__annotations.close()
+
+        categories = [{'id': class_id + 1, 'name': name} for name, class_id in sorted(CLASS_IDS.items(),
+                                                                                   key=lambda item: item[1])]
+        self.__file.write('], "categories": {}}}'.format(json.dumps(categories)))
+        self.__file.close()
+        os.replace(self.__tmpPath, self.path)
+
+    def abort(self):
+        self.__annotations.close()
+        self.__file.close()
+        os.remove(self.__tmpPath)
+
+
+class TFRecordShardWriter:
+    # Serialized examples into <prefix>-00000.tfrecord, <prefix>-00001.tfrecord, ... shard_size examples per file
+
+    def __init__(self, prefix, shard_size=1000):
+        import tensorflow as tf
+
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.__tf = tf
+        self.__writer = None
+        self.__shard = 0
+        self.__count = 0
+
+        os.makedirs(os.path.dirname(prefix), exist_ok=True)
+
+    def write(self, example):
+        if self.__writer is None or self.__count == self.shard_size:
+            self.close()
+            self.__writer = self.__tf.io.TFRecordWriter('{}-{:05d}.tfrecord'.format(self.prefix, self.__shard))
+            self.__shard += 1
+            self.__count = 0
+
+        self.__writer.write(example)
+        self.__count += 1
+
+    def close(self):
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export VOC annotations to COCO json, YOLO txt and TFRecord')
+    parser.add_argument('ann_dir')
+    parser.add_argument('img_dir')
+    parser.add_argument('output_dir')
+    parser.add_argument('--formats', nargs='+', choices=EXPORT_FORMATS, default=list(EXPORT_FORMATS))
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, every core by default')
+    parser.add_argument('--shard-size', type=int, default=1000, help='examples per TFRecord shard')
+    parser.add_argument('--min-size', type=int, default=1, help='drop boxes narrower or lower than this')
+    args = parser.parse_args()
+
+    count = export_dataset(args.ann_dir, args.img_dir, args.output_dir,
+                           formats=args.formats,
+                           workers=args.workers,
+                           shard_size=args.shard_size,
+                           min_size=args.min_size)
+    print('Exported {} images'.format(count))
@@ -0,0 +1,45 @@
+import time
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from frame_sampling import extract_frames
+
+
+class FrameExtractionWorker(QThread):
+    # Extracts the sampled frames of a video in the background and streams every saved frame path back to the
+    # GUI thread, so that labeling can start on the first frame while the rest is still being extracted.
+    frameExtracted = pyqtSignal(str)
+    progressChanged = pyqtSignal(int, int)
+
+    def __init__(self, videoPath, destinationPath, ratio=0.05, strategy='random', progressInterval=0.2, parent=None):
+        super().__init__(parent)
+        self.videoPath = videoPath
+        self.destinationPath = destinationPath
+        self.ratio = ratio
+        self.strategy = strategy
+        self.progressInterval = progressInterval
+        self.__stopped = False
+        self.__lastProgressTime = 0
+
+    def stop(self):
+        self.__stopped = True
+
+    def isStopped(self):
+        return self.__stopped
+
+    def run(self):
+        for framePath in extract_frames(self.videoPath, self.destinationPath,
+                                        ratio=self.ratio,
+                                        strategy=self.strategy,
+                                        progress=self.__reportProgress,
+                                        should_stop=self.isStopped):
+            if self.__stopped:
+                break
+            self.frameExtracted.emit(framePath)
+
+    def __reportProgress(self, done, total):
+        now = time.perf_counter()
+
+        if done == total or now - self.__lastProgressTime >= self.progressInterval:
+            self.__lastProgressTime = now
+            self.progressChanged.emit(done, total)
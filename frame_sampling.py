@@ -0,0 +1,93 @@
+import os
+import random
+
+from stage_timer import timer
+
+SAMPLING_STRATEGIES = ('random', 'uniform')
+
+
+def sample_frame_indices(length, ratio=0.05, strategy='random', seed=None):
+    # ratio is clamped to [0, 1], every strategy returns at most one index per frame
+    count = max(0, min(int(ratio * length), length))
+
+    if strategy == 'random':
+        indices = random.Random(seed).sample(range(length), count)
+    elif strategy == 'uniform':
+        indices = [int(i * length / count) for i in range(count)]
+    else:
+        raise ValueError('sampling strategy should be one of {}, got {}'.format(SAMPLING_STRATEGIES, strategy))
+
+    return sorted(indices)
+
+
+def extract_frames(video_path, destination_path, ratio=0.05, strategy='random', seed=None, seek_threshold=300,
+                   progress=None, skip_existing=False, should_stop=None):
+    # Yields the path of every saved frame. Frames between the sampled indices are only grabbed, not decoded,
+    # and gaps longer than seek_threshold frames are skipped by seeking (None disables seeking). Seeking is not frame
+    # accurate with every codec, so a seek that does not land on the asked frame switches to grabbing sequentially.
+    # With skip_existing, sampled frames whose file is already there are grabbed but not decoded nor saved again.
+    # should_stop() is polled before every seek and grab, so that a long gap between two frames can be interrupted.
+    import cv2
+    from PIL import Image
+
+    video_name = os.path.basename(video_path).split('.')[0]
+    cap = cv2.VideoCapture(video_path)
+
+    try:
+        length = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        indices = sample_frame_indices(length, ratio, strategy, seed)
+        position = 0
+        seeking = seek_threshold is not None
+
+        for done, index in enumerate(indices):
+            if should_stop is not None and should_stop():
+                return
+
+            # Seeking, grabbing up to the frame, decoding and saving it
+            with timer.stage('frame extraction'):
+                if seeking and index - position > seek_threshold:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+                    landed = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+
+                    if landed == index:
+                        position = index
+                    else:
+                        # Reopened at the first frame, the rest of the video is grabbed frame by frame
+                        seeking = False
+                        cap.release()
+                        cap = cv2.VideoCapture(video_path)
+                        position = 0
+
+                while position < index:
+                    if should_stop is not None and should_stop():
+                        return
+                    if not cap.grab():
+                        return
+                    position += 1
+
+                frame_path = os.path.join(destination_path, '{}_{}.jpg'.format(video_name, index))
+
+                if skip_existing and os.path.exists(frame_path):
+                    ret = cap.grab()
+                    position += 1
+
+                    if not ret:
+                        return
+                else:
+                    ret, frame = cap.read()
+                    position += 1
+
+                    if not ret:
+                        return
+
+                    # Renamed into place, so that an interrupted extraction never leaves a truncated frame behind
+                    tmp_path = frame_path + '.tmp'
+                    Image.fromarray(frame[..., ::-1]).save(tmp_path, format='JPEG')
+                    os.replace(tmp_path, frame_path)
+
+            if progress is not None:
+                progress(done + 1, len(indices))
+
+            yield frame_path
+    finally:
+        cap.release()
@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QSize
+from PyQt5.QtGui import QImageReader
+
+from stage_timer import timer
+
+
+def decodeScaledImage(imagePath, size):
+    # The original (width, height) comes from the file header and the image is decoded straight to size
+    # (JPEGs at a reduced DCT scale), so the full resolution buffer never exists
+    with timer.stage('image decode'):
+        reader = QImageReader(imagePath)
+        imageSize = reader.size()
+
+        if not imageSize.isValid():
+            # Formats that do not report their size up front are decoded in full and scaled
+            rawImage = reader.read()
+            return rawImage.scaled(*size), (rawImage.width(), rawImage.height())
+
+        reader.setScaledSize(QSize(*size))
+        return reader.read(), (imageSize.width(), imageSize.height())
+
+
+class ImagePrefetcher:
+    # Decodes upcoming images already scaled to the viewer size in background threads and keeps them in a
+    # memory bounded LRU. QImage (unlike QPixmap) can be used outside of the GUI thread.
+
+    def __init__(self, maxBytes=256 * 1024 * 1024, workers=2):
+        self.maxBytes = maxBytes
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='Thread-ImagePrefetch')
+        self.__lock = threading.Lock()
+        self.__images = OrderedDict()
+        self.__pending = {}
+        self.__totalBytes = 0
+
+    def prefetch(self, imagePaths, size):
+        with self.__lock:
+            for imagePath in imagePaths:
+                key = (imagePath, tuple(size))
+
+                if key not in self.__images and key not in self.__pending:
+                    self.__pending[key] = self.__executor.submit(self.__decode, key)
+
+    def get(self, imagePath, size):
+        # Returns (scaled image, (original width, original height))
+        key = (imagePath, tuple(size))
+
+        with self.__lock:
+            if key in self.__images:
+                self.__images.move_to_end(key)
+                return self.__images[key][:2]
+
+            future = self.__pending.get(key)
+
+        if future is not None:
+            return future.result()[:2]
+
+        return self.__decode(key)[:2]
+
+    def clear(self):
+        with self.__lock:
+            for future in self.__pending.values():
+                future.cancel()
+
+            self.__pending.clear()
+            self.__images.clear()
+            self.__totalBytes = 0
+
+    def close(self):
+        self.clear()
+        self.__executor.shutdown(wait=True, cancel_futures=True)
+
+    def __decode(self, key):
+        image, imageSize = decodeScaledImage(*key)
+        nbytes = image.sizeInBytes()
+
+        with self.__lock:
+            self.__pending.pop(key, None)
+
+            if key not in self.__images and not image.isNull():
+                self.__images[key] = (image, imageSize, nbytes)
+                self.__totalBytes += nbytes
+
+                while self.__totalBytes > self.maxBytes and len(self.__images) > 1:
+                    _, (_, _, evictedBytes) = self.__images.popitem(last=False)
+                    self.__totalBytes -= evictedBytes
+
+        return image, imageSize, nbytes
@@ -0,0 +1,111 @@
+import math
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtCore import QRect, QSize
+from PyQt5.QtGui import QImageReader
+
+from stage_timer import timer
+
+
+class ImagePyramid:
+    # Tiles of one image file at power of two downscales (level 0 is full resolution). Only the tiles asked for
+    # are decoded, in background threads through QImageReader clip and scaled size, and kept in a memory bounded
+    # LRU. onTileReady is called from the decoding thread once a requested tile is in the cache.
+
+    def __init__(self, imagePath, imageSize, executor, tileSize=512, maxBytes=128 * 1024 * 1024, onTileReady=None):
+        self.imagePath = imagePath
+        self.imageWidth, self.imageHeight = imageSize
+        self.tileSize = tileSize
+        self.maxBytes = maxBytes
+        self.__executor = executor
+        self.__onTileReady = onTileReady
+        self.__lock = threading.Lock()
+        self.__tiles = OrderedDict()
+        self.__pending = {}
+        self.__failed = set()
+        self.__totalBytes = 0
+        self.__closed = False
+
+        self.levelCount = 1
+        while max(self.imageWidth, self.imageHeight) >> (self.levelCount - 1) > tileSize:
+            self.levelCount += 1
+
+    def level(self, scale):
+        # Coarsest level that still has at least one image pixel per screen pixel at the given screen/image scale
+        if scale >= 1:
+            return 0
+
+        return max(0, min(int(math.floor(math.log2(1 / scale))), self.levelCount - 1))
+
+    def tiles(self, level, rect):
+        # Returns [(tile rect in image pixels, QImage or None)] for the tiles covering rect (image pixels).
+        # Tiles that are not decoded yet are None and get queued.
+        step = self.tileSize << level
+        rect = rect.intersected(QRect(0, 0, self.imageWidth, self.imageHeight))
+
+        if rect.isEmpty():
+            return []
+
+        tiles = []
+
+        with self.__lock:
+            for ty in range(rect.top() // step, rect.bottom() // step + 1):
+                for tx in range(rect.left() // step, rect.right() // step + 1):
+                    key = (level, tx, ty)
+                    image = self.__tiles.get(key)
+
+                    if image is not None:
+                        self.__tiles.move_to_end(key)
+                    elif key not in self.__pending and key not in self.__failed:
+                        self.__pending[key] = self.__executor.submit(self.__decode, key)
+
+                    tiles.append((self.__tileRect(key), image))
+
+        return tiles
+
+    def close(self):
+        with self.__lock:
+            self.__closed = True
+
+            for future in self.__pending.values():
+                future.cancel()
+
+            self.__pending.clear()
+            self.__tiles.clear()
+            self.__totalBytes = 0
+
+    def __tileRect(self, key):
+        level, tx, ty = key
+        step = self.tileSize << level
+        return QRect(tx * step, ty * step, step, step).intersected(QRect(0, 0, self.imageWidth, self.imageHeight))
+
+    def __decode(self, key):
+        level = key[0]
+        rect = self.__tileRect(key)
+
+        with timer.stage('tile decode'):
+            reader = QImageReader(self.imagePath)
+            reader.setClipRect(rect)
+            reader.setScaledSize(QSize(max(1, math.ceil(rect.width() / (1 << level))),
+                                       max(1, math.ceil(rect.height() / (1 << level)))))
+            image = reader.read()
+
+        with self.__lock:
+            self.__pending.pop(key, None)
+
+            if image.isNull():
+                self.__failed.add(key)
+
+            if self.__closed or image.isNull():
+                return
+
+            self.__tiles[key] = image
+            self.__totalBytes += image.sizeInBytes()
+
+            while self.__totalBytes > self.maxBytes and len(self.__tiles) > 1:
+                _, evicted = self.__tiles.popitem(last=False)
+                self.__totalBytes -= evicted.sizeInBytes()
+
+        if self.__onTileReady is not None:
+            self.__onTileReady()
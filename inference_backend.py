@@ -0,0 +1,187 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+BACKENDS = ('keras', 'onnx')
+
+
+class KerasBackend:
+    # The .h5 detector in TensorFlow/Keras. predict_on_batch runs the batch straight through the model, without the
+    # per call data pipeline model.predict builds. Thread counts have to be set before TensorFlow runs anything.
+
+    def __init__(self, model_path, intra_op_threads=None, inter_op_threads=None):
+        self.model_path = model_path
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.import_time = None
+        self.load_time = None
+        self.__model = None
+
+    def load(self):
+        start_time = time.perf_counter()
+        import tensorflow as tf
+        from keras.models import load_model
+        self.import_time = time.perf_counter() - start_time
+
+        if self.intra_op_threads is not None:
+            tf.config.threading.set_intra_op_parallelism_threads(self.intra_op_threads)
+        if self.inter_op_threads is not None:
+            tf.config.threading.set_inter_op_parallelism_threads(self.inter_op_threads)
+
+        start_time = time.perf_counter()
+        self.__model = load_model(self.model_path, custom_objects={'tf': tf})
+        self.load_time = time.perf_counter() - start_time
+
+    @property
+    def input_shape(self):
+        return tuple(self.__model.input_shape[1:])
+
+    def predict(self, input_images):
+        return np.asarray(self.__model.predict_on_batch(np.asarray(input_images, dtype=np.float32)))
+
+    def warm_up(self, batch_size=1):
+        # The first call builds the graph, doing it here keeps that off the first real prediction
+        self.predict(np.zeros((batch_size,) + self.input_shape, dtype=np.float32))
+
+
+class OnnxBackend:
+    # The detector converted to ONNX, run by ONNX Runtime on the CPU without TensorFlow. A .h5 model_path is
+    # converted once (convert_to_onnx) into the .onnx next to it, and again whenever the .h5 is newer.
+
+    def __init__(self, model_path, intra_op_threads=None, inter_op_threads=None):
+        self.model_path = model_path
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.import_time = None
+        self.load_time = None
+        self.__session = None
+        self.__input_name = None
+
+    @property
+    def onnx_path(self):
+        return onnx_path_of(self.model_path)
+
+    def load(self):
+        ensure_onnx(self.model_path)
+
+        start_time = time.perf_counter()
+        import onnxruntime as ort
+        self.import_time = time.perf_counter() - start_time
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        if self.intra_op_threads is not None:
+            options.intra_op_num_threads = self.intra_op_threads
+        if self.inter_op_threads is not None:
+            options.inter_op_num_threads = self.inter_op_threads
+            # The parallel executor only pays off for independent branches run on more than one thread,
+            # the sequential one is faster for this single path network
+            if self.inter_op_threads > 1:
+                options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+
+        start_time = time.perf_counter()
+        self.__session = ort.InferenceSession(self.onnx_path, options, providers=['CPUExecutionProvider'])
+        self.__input_name = self.__session.get_inputs()[0].name
+        self.load_time = time.perf_counter() - start_time
+
+    @property
+    def input_shape(self):
+        return tuple(self.__session.get_inputs()[0].shape[1:])
+
+    def predict(self, input_images):
+        return self.__session.run(None, {self.__input_name: np.asarray(input_images, dtype=np.float32)})[0]
+
+    def warm_up(self, batch_size=1):
+        self.predict(np.zeros((batch_size,) + self.input_shape, dtype=np.float32))
+
+
+def create_backend(name, model_path, intra_op_threads=None, inter_op_threads=None):
+    if name == 'keras':
+        return KerasBackend(model_path, intra_op_threads, inter_op_threads)
+    elif name == 'onnx':
+        return OnnxBackend(model_path, intra_op_threads, inter_op_threads)
+    else:
+        raise ValueError('inference backend should be one of {}, got {}'.format(BACKENDS, name))
+
+
+def onnx_path_of(model_path):
+    return os.path.splitext(model_path)[0] + '.onnx'
+
+
+def ensure_onnx(model_path):
+    # Converts a .h5 model_path that has no up to date .onnx yet, returns the .onnx path
+    onnx_path = onnx_path_of(model_path)
+
+    if onnx_path != model_path and (not os.path.exists(onnx_path) or
+                                    os.path.getmtime(onnx_path) < os.path.getmtime(model_path)):
+        convert_to_onnx(model_path, onnx_path)
+
+    return onnx_path
+
+
+def convert_to_onnx(h5_path, onnx_path=None, opset=13):
+    # Needs TensorFlow and tf2onnx once, the converted model is then run by ONNX Runtime alone.
+    # Written to a temporary file and renamed, so that an interrupted conversion is redone next time.
+    import tensorflow as tf
+    import tf2onnx
+    from keras.models import load_model
+
+    onnx_path = onnx_path_of(h5_path) if onnx_path is None else onnx_path
+    model = load_model(h5_path, custom_objects={'tf': tf})
+    input_signature = [tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name='input_image')]
+
+    tmp_path = onnx_path + '.tmp'
+    tf2onnx.convert.from_keras(model, input_signature=input_signature, opset=opset, output_path=tmp_path)
+    os.replace(tmp_path, onnx_path)
+
+    return onnx_path
+
+
+def compare_backends(model_path, image_paths, batch_size=8, atol=1, **prediction_kwargs):
+    # Runs both backends through predict_paths on the same images. Returns the paths whose boxes differ by more
+    # than atol pixels, or whose box count differs (a score right at obj_threshold may flip between backends).
+    from utils import predict_paths
+
+    results = []
+
+    for name in BACKENDS:
+        backend = create_backend(name, model_path)
+        backend.load()
+        results.append(predict_paths(image_paths, backend, batch_size=batch_size, **prediction_kwargs))
+
+    mismatches = []
+
+    for image_path, (keras_boxes, _), (onnx_boxes, _) in zip(image_paths, *results):
+        if len(keras_boxes) != len(onnx_boxes) or \
+                (len(keras_boxes) > 0 and np.abs(np.subtract(keras_boxes, onnx_boxes)).max() > atol):
+            mismatches.append(image_path)
+
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert the .h5 detector to ONNX and check both backends agree')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert', help='convert a .h5 model to ONNX')
+    convert_parser.add_argument('h5_path')
+    convert_parser.add_argument('onnx_path', nargs='?', default=None, help='<h5 name>.onnx by default')
+    convert_parser.add_argument('--opset', type=int, default=13)
+
+    check_parser = subparsers.add_parser('check', help='compare the Keras and ONNX boxes on some images')
+    check_parser.add_argument('h5_path')
+    check_parser.add_argument('image_paths', nargs='+')
+    check_parser.add_argument('--atol', type=float, default=1, help='allowed box difference in pixels')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        print('Converted to {}'.format(convert_to_onnx(args.h5_path, args.onnx_path, args.opset)))
+    else:
+        mismatches = compare_backends(args.h5_path, args.image_paths, atol=args.atol)
+
+        for image_path in mismatches:
+            print('Boxes differ: {}'.format(image_path))
+        print('{}/{} images match'.format(len(args.image_paths) - len(mismatches), len(args.image_paths)))
@@ -0,0 +1,13 @@
+from enum import Enum
+
+
+class Label(Enum):
+    SHIP = 'Ship'
+    SPEEDBOAT = 'Speed boat'
+    SAILBOAT = 'Sail boat'
+    BUOY = 'Buoy'
+    OTHER = 'Other'
+
+
+# Class ids follow the enum order, exporters and training code share them
+CLASS_IDS = {label.value: idx for idx, label in enumerate(Label)}
@@ -0,0 +1,130 @@
+import os
+import threading
+
+from utils import predict_paths
+
+
+class LookAheadLabeler:
+    # Runs the detector ahead of the annotator over the images of a folder/video session so that
+    # proposals for the next images are already in memory when they are shown.
+
+    def __init__(self, modelLoader, window=5, batchSize=4, cache=None):
+        self.__modelLoader = modelLoader
+        self.__cache = cache
+        self.__window = window
+        self.__batchSize = batchSize
+        self.__predictLock = threading.Lock()
+        self.__condition = threading.Condition()
+        self.__imagePaths = []
+        self.__currentIdx = 0
+        self.__session = 0
+        self.__proposals = {}
+        self.__failed = set()
+        self.__running = False
+        self.__thread = None
+
+    @property
+    def window(self):
+        return self.__window
+
+    @window.setter
+    def window(self, newWindow):
+        with self.__condition:
+            self.__window = newWindow
+            self.__condition.notify_all()
+
+    def start(self, imagePaths, currentIdx=0):
+        with self.__condition:
+            self.__imagePaths = list(imagePaths)
+            self.__currentIdx = currentIdx
+            self.__session += 1
+            self.__proposals.clear()
+            self.__failed.clear()
+            self.__running = True
+
+            if self.__thread is None or not self.__thread.is_alive():
+                self.__thread = threading.Thread(target=self.__run, name='Thread-LookAheadLabeler', daemon=True)
+                self.__thread.start()
+
+            self.__condition.notify_all()
+
+    def append(self, imagePaths):
+        with self.__condition:
+            self.__imagePaths.extend(imagePaths)
+            self.__condition.notify_all()
+
+    def advance(self, currentIdx):
+        with self.__condition:
+            self.__currentIdx = currentIdx
+            self.__prune()
+            self.__condition.notify_all()
+
+    def stop(self):
+        with self.__condition:
+            self.__running = False
+            self.__session += 1
+            self.__imagePaths = []
+            self.__proposals.clear()
+            self.__failed.clear()
+            self.__condition.notify_all()
+
+    def proposal(self, imagePath):
+        with self.__condition:
+            return self.__proposals.get(imagePath)
+
+    def detect(self, imagePath):
+        # Blocking detection used when no proposal has been made for the image yet.
+        proposal = self.proposal(imagePath)
+
+        if proposal is None:
+            with self.__predictLock:
+                proposal = predict_paths([imagePath], self.__loadModel, batch_size=1, cache=self.__cache)[0]
+
+        return proposal
+
+    def __loadModel(self):
+        # Passed to predict_paths instead of the model, so that cache hits never wait for the model to load
+        return self.__modelLoader.model
+
+    def __windowPaths(self):
+        return self.__imagePaths[self.__currentIdx:self.__currentIdx + self.__window]
+
+    def __prune(self):
+        window = set(self.__windowPaths())
+        for path in [path for path in self.__proposals if path not in window]:
+            del self.__proposals[path]
+
+    def __nextPaths(self):
+        window = self.__windowPaths()
+        pending = [path for path in window if path not in self.__proposals and path not in self.__failed]
+        return pending[:self.__batchSize]
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while not (self.__running and self.__nextPaths()):
+                    self.__condition.wait()
+
+                session = self.__session
+                paths = self.__nextPaths()
+
+            # The current image may be moved by save or removed from the folder in the meantime
+            existingPaths = [path for path in paths if os.path.exists(path)]
+
+            try:
+                with self.__predictLock:
+                    proposals = predict_paths(existingPaths, self.__loadModel, batch_size=self.__batchSize,
+                                              cache=self.__cache)
+            except Exception:
+                # e.g. grayscale or RGBA images the model can not take, AutoLabel reports those on demand
+                with self.__condition:
+                    self.__failed.update(paths)
+                continue
+
+            with self.__condition:
+                if session != self.__session:
+                    continue
+
+                self.__failed.update(set(paths) - set(existingPaths))
+                self.__proposals.update(zip(existingPaths, proposals))
+                self.__prune()
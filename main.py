@@ -1,26 +1,33 @@
 import os
 os.environ["CUDA_VISIBLE_DEVICES"] = ''
-import random
 import time
+startTime = time.perf_counter()
 
 from PyQt5.QtWidgets import QWidget, QApplication, QHBoxLayout, \
-    QFileDialog, QLabel, QRubberBand, QComboBox, QMenu, QMainWindow, QAction, QProgressBar
-from PyQt5.QtGui import QImage, QPixmap, QCursor, QColor, QPalette, QBrush, QIcon
-from PyQt5.QtCore import QPoint, QRect, QSize, pyqtSignal, Qt, pyqtSlot
+    QFileDialog, QLabel, QComboBox, QMenu, QMainWindow, QAction, QProgressBar
+from PyQt5.QtGui import QPixmap, QCursor, QColor, QIcon, QPainter, QPen
+from PyQt5.QtCore import QPoint, QPointF, QRect, QRectF, QSize, QSizeF, QTimer, pyqtSignal, Qt, pyqtSlot
 import sys
-from utils import ImageContainer, xml_root, instance_to_xml, prediction, load_image, globWithTypes
-from lxml import etree
+from utils import ImageContainer, globWithTypes
+from lookahead import LookAheadLabeler
+from prediction_cache import PredictionCache, DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE
+from model_loader import ModelLoader
+from inference_backend import BACKENDS
+from image_prefetch import ImagePrefetcher, decodeScaledImage
+from frame_extraction_worker import FrameExtractionWorker
+from save_writer import SaveWriter
+from annotation_store import AnnotationStore
+from labels import Label
+from box_index import BoxGridIndex
+from image_pyramid import ImagePyramid
+from stage_timer import timer as stageTimer
 from enum import Enum
-from keras.models import load_model
-import tensorflow as tf
 from glob import glob
 import os
-import shutil
 import threading
-import cv2
-import numpy as np
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 import math
-from PIL import Image
 
 
 class Mode(Enum):
@@ -34,6 +41,11 @@ class CorrectionMode(Enum):
     OTHER = -1
 
 
+class BoxShape(Enum):
+    LINE = 0
+    RECTANGLE = 1
+
+
 class ResizeMode(Enum):
     TOPLEFT = 0
     TOP = 1
@@ -58,14 +70,6 @@ class AppString(Enum):
     DESCRIPTION = 'Description'
 
 
-class Label(Enum):
-    SHIP = 'Ship'
-    SPEEDBOAT = 'Speed boat'
-    SAILBOAT = 'Sail boat'
-    BUOY = 'Buoy'
-    OTHER = 'Other'
-
-
 class Utils:
 
     @staticmethod
@@ -73,14 +77,46 @@ class Utils:
         QApplication.setOverrideCursor(QCursor(cursorShape))
 
 
-class BoundingBox(QRubberBand):
+class BoundingBox:
+    # Geometry and label of one annotation. Boxes are not widgets, the Viewer paints all of them in its paintEvent.
 
-    def __init__(self, shape, parent, label):
-        super().__init__(shape, parent)
+    def __init__(self, shape, label):
+        self.shape = shape
         self.pointCheckRange = 3
         self.canvasPositionRatio = (0, 0)
         self.canvasBoxRatio = (0, 0)
         self.label = label
+        # Position in the viewer's box list, lower first, kept without renumbering on insert at the front
+        self.order = 0
+        self.__rect = QRect()
+
+    def x(self):
+        return self.__rect.x()
+
+    def y(self):
+        return self.__rect.y()
+
+    def width(self):
+        return self.__rect.width()
+
+    def height(self):
+        return self.__rect.height()
+
+    def pos(self):
+        return self.__rect.topLeft()
+
+    def geometry(self):
+        return QRect(self.__rect)
+
+    def setGeometry(self, rect):
+        self.__rect = QRect(rect)
+
+    def move(self, *pos):
+        x, y = (pos[0].x(), pos[0].y()) if len(pos) == 1 else pos
+        self.__rect.moveTo(int(x), int(y))
+
+    def resize(self, width, height):
+        self.__rect.setSize(QSize(int(width), int(height)))
 
     def pointOnTopLeft(self, pos):
         return (self.x() <= pos.x() < self.x() + self.pointCheckRange) and \
@@ -117,12 +153,16 @@ class BoundingBox(QRubberBand):
 
 class Viewer(QLabel):
     changeBoxNum = pyqtSignal(int)
+    tileReady = pyqtSignal()
 
     def __init__(self, parent):
         super().__init__(parent)
 
         self.setMouseTracking(True)
         self.__boxes = []
+        self.__boxIndex = BoxGridIndex()
+        self.__frontOrder = 0
+        self.__backOrder = 0
         self.selectedIdx = -1
         self.drawingThreshold = 30
         self.origin = QPoint()
@@ -137,17 +177,35 @@ class Viewer(QLabel):
                            Label.SAILBOAT: Qt.darkGray,
                            Label.BUOY: Qt.red,
                            Label.OTHER: Qt.green}
+        self.resizeCursors = {ResizeMode.TOPLEFT: Qt.SizeFDiagCursor,
+                              ResizeMode.TOP: Qt.SizeVerCursor,
+                              ResizeMode.TOPRIGHT: Qt.SizeBDiagCursor,
+                              ResizeMode.RIGHT: Qt.SizeHorCursor,
+                              ResizeMode.BOTTOMRIGHT: Qt.SizeFDiagCursor,
+                              ResizeMode.BOTTOM: Qt.SizeVerCursor,
+                              ResizeMode.BOTTOMLEFT: Qt.SizeBDiagCursor,
+                              ResizeMode.LEFT: Qt.SizeHorCursor}
         self.__mouseLineVisible = True
-        self.__InitializeMouseLine()
+        self.__mouseLinePosition = None
         self.__shiftFlag = False
         self.__resized = False
 
-    def initialize(self):
-        for box in self.__boxes:
-            box.hide()
-            box.deleteLater()
+        # Zoom 1 shows the whole image. Box ratios are in image space, widget geometry follows the view.
+        self.maxPixelZoom = 8
+        self.zoomStep = 1.25
+        self.__zoom = 1.0
+        self.__viewOrigin = QPointF(0, 0)
+        self.__panOrigin = None
+        self.__preview = None
+        self.__imageSize = None
+        self.__pyramid = None
+        self.__tileExecutor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='Thread-ImageTile')
+        self.tileReady.connect(self.update)
 
+    def initialize(self):
         self.__boxes.clear()
+        self.__boxIndex.clear()
+        self.update()
         self.selectedIdx = -1
         self.origin = QPoint()
         self.__mode = Mode.LABELING
@@ -156,32 +214,76 @@ class Viewer(QLabel):
         self.resizeMode = ResizeMode.OTHER
         self.label = Label.SHIP
         self.__resized = False
+        self.__panOrigin = None
+        self.__setView(1.0, QPointF(0, 0))
+
+    def setImage(self, image, imagePath=None, imageSize=None):
+        # image is a viewer sized copy of the file at imagePath, imageSize its original (width, height).
+        # Zoomed in views draw the copy first and the tiles of the file decoded at the needed level over it.
+        self.__closePyramid()
+        self.__preview = QPixmap.fromImage(image)
+        self.__imageSize = imageSize if imageSize is not None else (image.width(), image.height())
+
+        if imagePath is not None:
+            self.__pyramid = ImagePyramid(imagePath, self.__imageSize, self.__tileExecutor,
+                                          onTileReady=self.tileReady.emit)
+
+        self.setPixmap(self.__preview)
+        self.__setView(1.0, QPointF(0, 0))
+
+    def shutdown(self):
+        # Called when the window closes, waits for the tile decodes already running
+        self.__closePyramid()
+        self.__tileExecutor.shutdown(wait=True, cancel_futures=True)
+
+    def clearImage(self):
+        self.__closePyramid()
+        self.__preview = None
+        self.__imageSize = None
+
+        pixmap = QPixmap(self.width(), self.height())
+        pixmap.fill(QColor(Qt.gray))
+        self.setPixmap(pixmap)
+        self.__setView(1.0, QPointF(0, 0))
+
+    def resetZoom(self):
+        self.__setView(1.0, QPointF(0, 0))
+
+    def zoomAt(self, pos, factor):
+        # The image point under pos stays under pos
+        if self.__imageSize is None:
+            return
 
-    def autoLabeling(self, boundingBoxes):
-        for box in self.__boxes:
-            box.hide()
-            box.deleteLater()
+        maxZoom = self.maxPixelZoom * min(self.__imageSize[0] / self.width(), self.__imageSize[1] / self.height())
+        zoom = max(1.0, min(self.__zoom * factor, maxZoom))
+        anchor = self.__toImageRatio(pos)
+
+        self.__setView(zoom, QPointF(anchor.x() - pos.x() / (zoom * self.width()),
+                                     anchor.y() - pos.y() / (zoom * self.height())))
+
+    def panBy(self, delta):
+        self.__setView(self.__zoom, QPointF(self.__viewOrigin.x() - delta.x() / (self.__zoom * self.width()),
+                                            self.__viewOrigin.y() - delta.y() / (self.__zoom * self.height())))
 
+    def autoLabeling(self, boundingBoxes):
+        # boundingBoxes are (x, y, w, h) as fractions of the image width and height
         self.__boxes.clear()
+        self.__boxIndex.clear()
 
-        for idx, bbox in enumerate(boundingBoxes):
+        for bbox in boundingBoxes:
             x, y, w, h = bbox
-            x = max(0, min(x, self.width()))
-            y = max(0, min(y, self.height()))
-            w = max(0, min(w, self.width()-x))
-            h = max(0, min(h, self.width()-y))
-
-            self.__boxes.append(BoundingBox(QRubberBand.Rectangle, self, Label.SHIP))
-            self.__boxes[idx].setGeometry(QRect(x, y, w, h))
-            self.__boxes[idx].geometry()
-            self.__boxes[idx].setPalette(self.__boundingBoxColor(Label.SHIP)) # TODO - Multi classification Labeling
-            self.__boxes[idx].show()
-
-            self.__boxes[idx].canvasPositionRatio = \
-                (self.__boxes[idx].pos().x() / self.width(), self.__boxes[idx].pos().y() / self.height())
-            self.__boxes[idx].canvasBoxRatio = \
-                (self.__boxes[idx].width() / self.width(), self.__boxes[idx].height() / self.height())
-
+            x = max(0, min(x, 1))
+            y = max(0, min(y, 1))
+            w = max(0, min(w, 1-x))
+            h = max(0, min(h, 1-y))
+
+            box = BoundingBox(BoxShape.RECTANGLE, Label.SHIP) # TODO - Multi classification Labeling
+            box.canvasPositionRatio = (x, y)
+            box.canvasBoxRatio = (w, h)
+            self.__addBox(box)
+
+        self.__layoutBoxes()
+        self.update()
         self.changeBoxNum.emit(len(self.__boxes))
 
     @property
@@ -198,21 +300,17 @@ class Viewer(QLabel):
 
     @mouseLineVisible.setter
     def mouseLineVisible(self, flag):
-        self.__mouseLineVisible = flag
-
-        if self.__mouseLineVisible:
-            for mouseLine in self.__mouseLines:
-                mouseLine.show()
-        else:
-            for mouseLine in self.__mouseLines:
-                mouseLine.hide()
+        if self.__mouseLineVisible != flag:
+            self.__mouseLineVisible = flag
+            self.__updateMouseLine()
 
     @property
     def boxes(self):
+        # (x, y, w, h, label) as fractions of the image width and height, independent of zoom and window size
         bndBox = []
 
         for box in self.__boxes:
-            bndBox.append([box.x(), box.y(), box.width(), box.height(), box.label])
+            bndBox.append([*box.canvasPositionRatio, *box.canvasBoxRatio, box.label])
         return bndBox
 
     @property
@@ -235,36 +333,39 @@ class Viewer(QLabel):
         if QMouseEvent.button() == Qt.LeftButton:
             if self.__mode == Mode.LABELING:
                 self.origin = QMouseEvent.pos()
-                box = BoundingBox(QRubberBand.Line, self, self.label)
-                box.setGeometry(QRect(self.origin, QSize()))
-                box.geometry()
-                box.setPalette(self.__boundingBoxColor())
-                box.show()
-                QHBoxLayout().addWidget(box)
-
-                self.__boxes.insert(0, box)
+                box = BoundingBox(BoxShape.LINE, self.label)
+                box.setGeometry(QRect(self.origin, QSize(0, 0)))
+
+                self.__addBox(box, front=True)
                 self.__makeBoundingBox = True
             elif self.__mode == Mode.CORRECTION:
-                selectedIdx, resizeMode = self.__findResizingBox(QMouseEvent)
+                selectedBox, resizeMode = self.__findResizingBox(QMouseEvent.pos())
 
-                if selectedIdx >= 0:
+                if selectedBox is not None:
                     self.__correctionMode = CorrectionMode.RESIZE
                     self.resizeMode = resizeMode
                 else:
-                    selectedIdx = self.__findCorrectionBox(QMouseEvent)
+                    selectedBox = self.__findCorrectionBox(QMouseEvent.pos())
 
-                    if selectedIdx >= 0:
+                    if selectedBox is not None:
                         self.__correctionMode = CorrectionMode.MOVE
                         Utils.changeCursor(Qt.ClosedHandCursor)
-                        self.translateOffset = QMouseEvent.pos() - self.__boxes[selectedIdx].pos()
-                self.selectedIdx = selectedIdx
+                        self.translateOffset = QMouseEvent.pos() - selectedBox.pos()
+                self.selectedIdx = self.__boxIdx(selectedBox)
+        elif QMouseEvent.button() == Qt.MiddleButton and self.__isIdle():
+            self.__panOrigin = QMouseEvent.pos()
+            Utils.changeCursor(Qt.ClosedHandCursor)
         super().mousePressEvent(QMouseEvent)
 
     def mouseMoveEvent(self, QMouseEvent):
         self.__setMouseLinePosition(QMouseEvent.pos())
 
+        if self.__panOrigin is not None:
+            self.panBy(QMouseEvent.pos() - self.__panOrigin)
+            self.__panOrigin = QMouseEvent.pos()
+
         if self.__mode == Mode.CORRECTION and self.__correctionMode == CorrectionMode.OTHER:
-            self.__findResizingBox(QMouseEvent)
+            self.__findResizingBox(QMouseEvent.pos())
 
         if self.__mode == Mode.LABELING and self.__resized:
             if self.rect().contains(QMouseEvent.pos()):
@@ -274,40 +375,42 @@ class Viewer(QLabel):
 
         if self.__makeBoundingBox:
             clipCoord = self.__clipCoordinateInWidget(QMouseEvent)
-            self.__boxes[0].setGeometry(QRect(self.origin, clipCoord).normalized())
-            self.__boxes[0].geometry()
+            self.__setBoxGeometry(self.__boxes[0], QRect(self.origin, clipCoord).normalized())
         elif self.__correctionMode != CorrectionMode.OTHER:
             selectedBox = self.__boxes[self.selectedIdx]
             if self.__correctionMode == CorrectionMode.RESIZE:
 
                 newX, newY, newW, newH = self.__getResizeDimension(selectedBox, QMouseEvent.pos(), self.resizeMode)
 
-                selectedBox.setGeometry(QRect(newX, newY, newW, newH))
-                selectedBox.geometry()
+                self.__setBoxGeometry(selectedBox, QRect(newX, newY, newW, newH))
 
             elif self.__correctionMode == CorrectionMode.MOVE:
+                imageRect = self.__imageWidgetRect()
                 nextCenterPosition = QMouseEvent.pos() - self.translateOffset
-                nextCenterPosition.setX(max(0, min(nextCenterPosition.x(), self.width() - selectedBox.width())))
-                nextCenterPosition.setY(max(0, min(nextCenterPosition.y(), self.height() - selectedBox.height())))
-                selectedBox.move(nextCenterPosition)
+                nextCenterPosition.setX(max(imageRect.left(), min(nextCenterPosition.x(),
+                                                                  imageRect.left() + imageRect.width() - selectedBox.width())))
+                nextCenterPosition.setY(max(imageRect.top(), min(nextCenterPosition.y(),
+                                                                 imageRect.top() + imageRect.height() - selectedBox.height())))
+                self.__setBoxGeometry(selectedBox, QRect(nextCenterPosition, selectedBox.geometry().size()))
         super().mouseMoveEvent(QMouseEvent)
 
     def mouseReleaseEvent(self, QMouseEvent):
         Utils.changeCursor(Qt.ArrowCursor)
+        if QMouseEvent.button() == Qt.MiddleButton:
+            self.__panOrigin = None
+
         if self.__makeBoundingBox:
             if self.__boxes[0].width() * self.__boxes[0].height() < self.drawingThreshold:
                 self.removeBoundingBox(0)
             else:
-                self.__boxes[0].canvasPositionRatio = (self.__boxes[0].pos().x() / self.width(), self.__boxes[0].pos().y() / self.height())
-                self.__boxes[0].canvasBoxRatio = (self.__boxes[0].width() / self.width(), self.__boxes[0].height() / self.height())
+                self.__storeBoxRatio(self.__boxes[0])
                 self.changeBoxNum.emit(len(self.__boxes))
             self.__makeBoundingBox = False
 
         if self.__correctionMode != CorrectionMode.OTHER:
             selectedBox = self.__boxes[self.selectedIdx]
             if self.__correctionMode == CorrectionMode.RESIZE:
-                selectedBox.canvasBoxRatio = (selectedBox.width() / self.width(), selectedBox.height() / self.height())
-                selectedBox.canvasPositionRatio = (selectedBox.pos().x() / self.width(), selectedBox.pos().y() / self.height())
+                self.__storeBoxRatio(selectedBox)
 
                 if selectedBox.width() * selectedBox.height() < self.drawingThreshold:
                     self.removeBoundingBox(self.selectedIdx)
@@ -315,7 +418,7 @@ class Viewer(QLabel):
                 self.resizeMode = ResizeMode.OTHER
 
             elif self.__correctionMode == CorrectionMode.MOVE:
-                selectedBox.canvasPositionRatio = (selectedBox.pos().x() / self.width(), selectedBox.pos().y() / self.height())
+                self.__storeBoxRatio(selectedBox)
 
             # TODO - Remove Invalid Bounding boxes with Area Threshold or Some Rules
             self.__correctionMode = CorrectionMode.OTHER
@@ -329,14 +432,15 @@ class Viewer(QLabel):
 
     def resizeEvent(self, QResizeEvent):
         if QResizeEvent.oldSize().isValid():
-            newSize = QResizeEvent.size()
-            for box in self.__boxes:
-                box.resize(newSize.width() * box.canvasBoxRatio[0], newSize.height() * box.canvasBoxRatio[1])
-                box.move(newSize.width() * box.canvasPositionRatio[0], newSize.height() * box.canvasPositionRatio[1])
-
+            self.__layoutBoxes()
+            self.update()
             self.__resized = True
         super().resizeEvent(QResizeEvent)
 
+    def wheelEvent(self, QWheelEvent):
+        if self.__isIdle():
+            self.zoomAt(QWheelEvent.pos(), self.zoomStep ** (QWheelEvent.angleDelta().y() / 120))
+
     def leaveEvent(self, QEvent):
         if self.mode == Mode.LABELING:
             self.mouseLineVisible = False
@@ -347,7 +451,7 @@ class Viewer(QLabel):
             self.__setMouseLinePosition(QEvent.pos())
 
     def contextMenuEvent(self, event):
-        selectedIdx = self.__findCorrectionBox(event.pos())
+        selectedIdx = self.__boxIdx(self.__findCorrectionBox(event.pos()))
 
         if selectedIdx >= 0:
             contextMenu = QMenu(self)
@@ -366,8 +470,9 @@ class Viewer(QLabel):
                     self.removeBoundingBox(selectedIdx)
                 else:
                     selectedBox = self.__boxes[selectedIdx]
+                    oldArea = self.__boxArea(selectedBox)
                     selectedBox.label = Label(action.text())
-                    selectedBox.setPalette(self.__boundingBoxColor(Label(action.text())))
+                    self.update(oldArea.united(self.__boxArea(selectedBox)))
 
     def setLabel(self, newLabel):
         self.label = Label(newLabel)
@@ -378,37 +483,148 @@ class Viewer(QLabel):
             self.selectedIdx = -1
 
         if 0 <= idx < len(self.__boxes):
-            self.__boxes[idx].hide()
-            self.__boxes[idx].deleteLater()
-            self.__boxes.pop(idx)
+            box = self.__boxes.pop(idx)
+            self.__boxIndex.remove(box)
+            self.update(self.__boxArea(box))
             self.changeBoxNum.emit(len(self.__boxes))
 
+    def paintEvent(self, QPaintEvent):
+        # The image, boxes, their labels and the crosshair are painted in one pass. Only what intersects the
+        # dirty rectangle is drawn, boxes in list order first so that it ends up on top.
+        dirtyRect = QPaintEvent.rect()
+
+        if self.__preview is None:
+            super().paintEvent(QPaintEvent)
+
+        painter = QPainter(self)
+
+        if self.__preview is not None:
+            self.__paintImage(painter, dirtyRect)
+
+        for box in reversed(self.__boxes):
+            if not self.__boxArea(box).intersects(dirtyRect):
+                continue
+
+            color = self.__boundingBoxColor(box.label)
+            painter.setPen(QPen(color, 2))
+
+            if box.shape == BoxShape.RECTANGLE:
+                fillColor = QColor(color)
+                fillColor.setAlpha(80)
+                painter.setBrush(fillColor)
+            else:
+                painter.setBrush(Qt.NoBrush)
+
+            painter.drawRect(box.geometry())
+            painter.drawText(box.x(), box.y() - painter.fontMetrics().descent() - 2, box.label.value)
+
+        if self.__mouseLineVisible and self.__mouseLinePosition is not None:
+            painter.setPen(QPen(self.__boundingBoxColor(Label.OTHER), 1))
+            painter.drawLine(self.__mouseLinePosition.x(), 0, self.__mouseLinePosition.x(), self.height())
+            painter.drawLine(0, self.__mouseLinePosition.y(), self.width(), self.__mouseLinePosition.y())
+
+        painter.end()
+
+    def __paintImage(self, painter, dirtyRect):
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+
+        previewW, previewH = self.__preview.width(), self.__preview.height()
+        painter.drawPixmap(QRectF(self.rect()), self.__preview,
+                           QRectF(self.__viewOrigin.x() * previewW, self.__viewOrigin.y() * previewH,
+                                  previewW / self.__zoom, previewH / self.__zoom))
+
+        imageW, imageH = self.__imageSize
+        scale = self.__zoom * max(self.width() / imageW, self.height() / imageH)
+
+        # The viewer sized copy is enough until the view needs more pixels than it has
+        if self.__pyramid is None or (self.__zoom * self.width() <= previewW and self.__zoom * self.height() <= previewH):
+            return
+
+        topLeft = self.__toImageRatio(dirtyRect.topLeft())
+        bottomRight = self.__toImageRatio(dirtyRect.bottomRight() + QPoint(1, 1))
+        dirtyImageRect = QRectF(QPointF(topLeft.x() * imageW, topLeft.y() * imageH),
+                                QPointF(bottomRight.x() * imageW, bottomRight.y() * imageH)).toAlignedRect()
+
+        for tileRect, tile in self.__pyramid.tiles(self.__pyramid.level(scale), dirtyImageRect):
+            if tile is not None:
+                target = QRectF(self.__toWidget(tileRect.x() / imageW, tileRect.y() / imageH),
+                                QSizeF(tileRect.width() * self.__zoom * self.width() / imageW,
+                                       tileRect.height() * self.__zoom * self.height() / imageH))
+                painter.drawImage(target, tile)
+
+    def __isIdle(self):
+        return not self.__makeBoundingBox and self.__correctionMode == CorrectionMode.OTHER
+
+    def __closePyramid(self):
+        if self.__pyramid is not None:
+            self.__pyramid.close()
+            self.__pyramid = None
+
+    def __setView(self, zoom, origin):
+        limit = 1 - 1 / zoom
+        self.__zoom = zoom
+        self.__viewOrigin = QPointF(max(0., min(origin.x(), limit)), max(0., min(origin.y(), limit)))
+        self.__layoutBoxes()
+        self.update()
+
+    def __toImageRatio(self, pos):
+        return QPointF(self.__viewOrigin.x() + pos.x() / (self.__zoom * self.width()),
+                       self.__viewOrigin.y() + pos.y() / (self.__zoom * self.height()))
+
+    def __toWidget(self, xRatio, yRatio):
+        return QPointF((xRatio - self.__viewOrigin.x()) * self.__zoom * self.width(),
+                       (yRatio - self.__viewOrigin.y()) * self.__zoom * self.height())
+
+    def __imageWidgetRect(self):
+        topLeft = self.__toWidget(0, 0)
+        return QRect(round(topLeft.x()), round(topLeft.y()),
+                     round(self.__zoom * self.width()), round(self.__zoom * self.height()))
+
+    def __storeBoxRatio(self, box):
+        topLeft = self.__toImageRatio(box.pos())
+        box.canvasPositionRatio = (topLeft.x(), topLeft.y())
+        box.canvasBoxRatio = (box.width() / (self.__zoom * self.width()), box.height() / (self.__zoom * self.height()))
+
+    def __layoutBoxes(self):
+        for box in self.__boxes:
+            topLeft = self.__toWidget(*box.canvasPositionRatio)
+            box.move(topLeft.x(), topLeft.y())
+            box.resize(box.canvasBoxRatio[0] * self.__zoom * self.width(), box.canvasBoxRatio[1] * self.__zoom * self.height())
+            self.__indexBox(box)
+
+    def __boxArea(self, box):
+        # Widget area painted for a box: its rectangle with the pen width and the label text above it
+        fontMetrics = self.fontMetrics()
+        textRect = QRect(box.x(), box.y() - fontMetrics.height() - 2,
+                         fontMetrics.boundingRect(box.label.value).width() + 2, fontMetrics.height() + 2)
+
+        return box.geometry().united(textRect).adjusted(-2, -2, 2, 2)
+
+    def __setBoxGeometry(self, box, rect):
+        oldArea = self.__boxArea(box)
+        box.setGeometry(rect)
+        self.__indexBox(box)
+        self.update(oldArea.united(self.__boxArea(box)))
+
     def __setMouseLinePosition(self, position):
-        self.__mouseLines[0].setGeometry(QRect(QPoint(position.x(), 0), QPoint(position.x(), position.y())))
-        self.__mouseLines[1].setGeometry(
-            QRect(QPoint(position.x(), position.y()), QPoint(position.x(), self.height())))
-        self.__mouseLines[2].setGeometry(QRect(QPoint(0, position.y()), QPoint(position.x(), position.y())))
-        self.__mouseLines[3].setGeometry(
-            QRect(QPoint(position.x(), position.y()), QPoint(self.width(), position.y())))
+        if self.__mouseLineVisible:
+            self.__updateMouseLine()
+
+        self.__mouseLinePosition = QPoint(position)
 
-    def __InitializeMouseLine(self):
-        self.__mouseLines = [QRubberBand(QRubberBand.Line, self) for _ in range(4)]
+        if self.__mouseLineVisible:
+            self.__updateMouseLine()
 
-        for mouseLine in self.__mouseLines:
-            mouseLine.setGeometry(QRect(QPoint(0, 0), QPoint(0, 0)))
-            mouseLine.setPalette(self.__boundingBoxColor(Label.OTHER))
-            mouseLine.show()
+    def __updateMouseLine(self):
+        if self.__mouseLinePosition is not None:
+            self.update(QRect(self.__mouseLinePosition.x() - 1, 0, 3, self.height()))
+            self.update(QRect(0, self.__mouseLinePosition.y() - 1, self.width(), 3))
 
     def __boundingBoxColor(self, label=None):
         if label is None:
             label = self.label
 
-        color = QColor(self.colorTable[label])
-        palette = QPalette()
-        color.setAlpha(80)
-        palette.setBrush(QPalette.Highlight, QBrush(color))
-
-        return palette
+        return QColor(self.colorTable[label])
 
     def __getResizeDimension(self, box, mousePos, resizeMode):
         oldTopLeftX, oldTopLeftY = box.pos().x(), box.pos().y()
@@ -524,54 +740,74 @@ class Viewer(QLabel):
 
         return (newX, newY, newW, newH)
 
-    def __findResizingBox(self, QMouseEvent):
-        for idx, box in enumerate(self.__boxes):
-            resizeMode = self.__mouseOnEdge(box, QMouseEvent)
-            if resizeMode != ResizeMode.OTHER:
-                return idx, resizeMode
-        return -1, ResizeMode.OTHER
+    def __addBox(self, box, front=False):
+        if front:
+            self.__frontOrder -= 1
+            box.order = self.__frontOrder
+            self.__boxes.insert(0, box)
+        else:
+            self.__backOrder += 1
+            box.order = self.__backOrder
+            self.__boxes.append(box)
+
+        self.__indexBox(box)
+
+    def __indexBox(self, box):
+        # Only the visible part is indexed, a box of a zoomed in view can cover far more cells than the widget
+        visible = box.geometry().intersected(self.rect())
+
+        if visible.isEmpty():
+            self.__boxIndex.remove(box)
+        else:
+            self.__boxIndex.insert(box, visible.x(), visible.y(), visible.width(), visible.height())
+
+    def __boxIdx(self, box):
+        return self.__boxes.index(box) if box is not None else -1
+
+    def __findResizingBox(self, pos):
+        # The first box in list order with an edge under the mouse, only the boxes of the mouse's grid cell are tested
+        onEdge = [box for box in self.__boxIndex.query(pos.x(), pos.y()) if self.__mouseOnEdge(box, pos) != ResizeMode.OTHER]
+        box = min(onEdge, key=lambda box: box.order, default=None)
 
-    def __mouseOnEdge(self, box:BoundingBox, QMouseEvent):
-        if box.pointOnTopLeft(QMouseEvent):
-            Utils.changeCursor(Qt.SizeFDiagCursor)
+        if box is None:
+            Utils.changeCursor(Qt.ArrowCursor)
+            return None, ResizeMode.OTHER
+
+        resizeMode = self.__mouseOnEdge(box, pos)
+        Utils.changeCursor(self.resizeCursors[resizeMode])
+        return box, resizeMode
+
+    def __mouseOnEdge(self, box:BoundingBox, pos):
+        if box.pointOnTopLeft(pos):
             return ResizeMode.TOPLEFT
-        elif box.pointOnTop(QMouseEvent):
-            Utils.changeCursor(Qt.SizeVerCursor)
+        elif box.pointOnTop(pos):
             return ResizeMode.TOP
-        elif box.pointOnTopRight(QMouseEvent):
-            Utils.changeCursor(Qt.SizeBDiagCursor)
+        elif box.pointOnTopRight(pos):
             return ResizeMode.TOPRIGHT
-        elif box.pointOnRight(QMouseEvent):
-            Utils.changeCursor(Qt.SizeHorCursor)
+        elif box.pointOnRight(pos):
             return ResizeMode.RIGHT
-        elif box.pointOnBottomRight(QMouseEvent):
-            Utils.changeCursor(Qt.SizeFDiagCursor)
+        elif box.pointOnBottomRight(pos):
             return ResizeMode.BOTTOMRIGHT
-        elif box.pointOnBottom(QMouseEvent):
-            Utils.changeCursor(Qt.SizeVerCursor)
+        elif box.pointOnBottom(pos):
             return ResizeMode.BOTTOM
-        elif box.pointOnBottomLeft(QMouseEvent):
-            Utils.changeCursor(Qt.SizeBDiagCursor)
+        elif box.pointOnBottomLeft(pos):
             return ResizeMode.BOTTOMLEFT
-        elif box.pointOnLeft(QMouseEvent):
-            Utils.changeCursor(Qt.SizeHorCursor)
+        elif box.pointOnLeft(pos):
             return ResizeMode.LEFT
         else:
-            Utils.changeCursor(Qt.ArrowCursor)
             return ResizeMode.OTHER
 
     def __clipCoordinateInWidget(self, QMouseEvent):
+        imageRect = self.__imageWidgetRect()
         clipCoord = QPoint()
-        clipCoord.setX(max(0, min(QMouseEvent.x(), self.width())))
-        clipCoord.setY(max(0, min(QMouseEvent.y(), self.height())))
+        clipCoord.setX(max(0, imageRect.left(), min(QMouseEvent.x(), self.width(), imageRect.left() + imageRect.width())))
+        clipCoord.setY(max(0, imageRect.top(), min(QMouseEvent.y(), self.height(), imageRect.top() + imageRect.height())))
 
         return clipCoord
 
-    def __findCorrectionBox(self, QMouseEvent):
-        for idx, box in enumerate(self.__boxes):
-            if self.__mouseInBox(QMouseEvent, box):
-                return idx
-        return -1
+    def __findCorrectionBox(self, pos):
+        inBox = [box for box in self.__boxIndex.query(pos.x(), pos.y()) if self.__mouseInBox(pos, box)]
+        return min(inBox, key=lambda box: box.order, default=None)
 
     def __mouseInBox(self, QMouseEvent, box):
         inX = box.x() <= QMouseEvent.x() < box.x() + box.width()
@@ -591,6 +827,18 @@ class MainUI(object):
         self.allowImageType = '(*.jpg *.png *.jpeg)'
         self.allowVideoType = '(*.mp4 *.avi)'
 
+        self.modelPath = './yolov2_ship_model.h5'
+        self.inferenceBackend = 'keras'
+        self.inferenceThreads = None
+        self.lookAheadWindow = 5
+        self.predictionCacheDir = DEFAULT_CACHE_DIR
+        self.predictionCacheSize = DEFAULT_CACHE_SIZE
+        self.imagePrefetchDepth = 3
+        self.frameSamplingRatio = 0.05
+        self.frameSamplingStrategy = 'random'
+        self.imageCacheSize = 256 * 1024 * 1024
+        self.stageStatsInterval = 1000
+
     def setupUi(self):
         self.loadFileBtn = QAction(QIcon('./icon/file-add-outline.svg'), AppString.LOADFILE.value, self)
         self.loadFileBtn.setIconText(AppString.LOADFILE.value)
@@ -642,6 +890,10 @@ class MainUI(object):
         self.notification = QLabel(Mode.LABELING.name, self)
         self.notification.setStyleSheet('background-color: rgb(0, 255, 0)')
         self.boundingBoxNum = QLabel('| Box: 0')
+        self.modelStatus = QLabel('| Model: -')
+        self.stageStats = QLabel('')
+        self.stageStats.setToolTip('p50/p95 of the last {} runs of each stage, F12 to hide'.format(stageTimer.window))
+        self.stageStats.hide()
 
         self.description = QLabel('')
         self.pbar = QProgressBar(self)
@@ -652,7 +904,9 @@ class MainUI(object):
         self.bottomBar.setStyleSheet("background-color: rgb(200, 200, 200)")
         self.bottomBar.addWidget(self.notification)
         self.bottomBar.addWidget(self.boundingBoxNum)
+        self.bottomBar.addWidget(self.modelStatus)
         self.bottomBar.addWidget(self.remainingNotification)
+        self.bottomBar.addWidget(self.stageStats)
         self.bottomBar.addPermanentWidget(self.description)
         self.bottomBar.addPermanentWidget(self.pbar)
 
@@ -662,10 +916,24 @@ class MainUI(object):
 
 
 class Labeling(QMainWindow, MainUI):
-    def __init__(self):
+    modelReady = pyqtSignal()
+    modelFailed = pyqtSignal(str)
+    autoLabelFinished = pyqtSignal(int, str, object)
+    autoLabelFailed = pyqtSignal(int, str, str)
+    saveFinished = pyqtSignal(str)
+    saveFailed = pyqtSignal(str)
+
+    def __init__(self, reportStartupTime=False, annotationDatabasePath=None, showStageStats=False, stageLogPath=None,
+                 inferenceBackend=None, inferenceThreads=None):
         super().__init__()
+        self.annotationDatabasePath = annotationDatabasePath
         Utils.changeCursor(Qt.WaitCursor)
         self.setupUi()
+
+        if inferenceBackend is not None:
+            self.inferenceBackend = inferenceBackend
+        if inferenceThreads is not None:
+            self.inferenceThreads = inferenceThreads
         self.setWindowIcon(QIcon('./icon/favicon.png'))
         self.setMinimumSize(self.windowWidth, self.windowHeight)
         self.loadFileBtn.triggered.connect(self.openFileDialogue)
@@ -674,6 +942,12 @@ class Labeling(QMainWindow, MainUI):
         self.saveBtn.triggered.connect(self.saveFileDialogue)
         self.autoLabelBtn.triggered.connect(self.autoLabel)
         self.viewer.changeBoxNum.connect(self.changeBoxNum)
+        self.modelReady.connect(self.onModelReady)
+        self.modelFailed.connect(self.onModelFailed)
+        self.autoLabelFinished.connect(self.onAutoLabelFinished)
+        self.autoLabelFailed.connect(self.onAutoLabelFailed)
+        self.saveFinished.connect(self.onSaveFinished)
+        self.saveFailed.connect(self.onSaveFailed)
 
         for label in Label:
             pixmap = QPixmap(12, 12)
@@ -687,10 +961,89 @@ class Labeling(QMainWindow, MainUI):
         self.setFocus()
         self.loadImage = None
         self.getMultipleInput = False
-        self.yolo = load_model('./yolov2_ship_model.h5', custom_objects={'tf': tf})
+        self.reportStartupTime = reportStartupTime
+        self.windowShownTime = time.perf_counter() - startTime
+
+        # The inference runtime is imported and the model is loaded in the background once the window is usable
+        self.modelLoader = ModelLoader(self.modelPath, onReady=self.modelReady.emit, onError=self.modelFailed.emit,
+                                       backend=self.inferenceBackend, intraOpThreads=self.inferenceThreads)
+        self.predictionCache = PredictionCache(self.predictionCacheDir, self.modelPath, self.predictionCacheSize,
+                                               backend=self.inferenceBackend)
+        self.lookAhead = LookAheadLabeler(self.modelLoader, window=self.lookAheadWindow, cache=self.predictionCache)
+        self.modelStatus.setText('| Model: loading')
+        self.modelLoader.warmUp()
+
+        self.imagePrefetcher = ImagePrefetcher(maxBytes=self.imageCacheSize)
+        self.frameExtractor = None
+
+        self.autoLabelExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='Thread-AutoLabel')
+        self.autoLabelRequest = 0
+        self.autoLabelFuture = None
+        # With an annotation database every session is saved into it instead of one xml file per image
+        annotationStore = AnnotationStore(self.annotationDatabasePath) if self.annotationDatabasePath is not None else None
+        self.saveWriter = SaveWriter(onSaved=self.saveFinished.emit, onError=self.saveFailed.emit, store=annotationStore)
+
+        # Stages are only timed while the stats panel is shown or a stage log is written
+        self.stageLogPath = stageLogPath
+        self.stageStatsTimer = QTimer(self)
+        self.stageStatsTimer.timeout.connect(self.updateStageStats)
+
+        if self.stageLogPath is not None:
+            stageTimer.enable(self.stageLogPath)
+        if showStageStats:
+            self.toggleStageStats()
         Utils.changeCursor(Qt.ArrowCursor)
 
+    @pyqtSlot()
+    def onModelReady(self):
+        self.modelStatus.setText('| Model: ready')
+
+        if self.reportStartupTime:
+            print('GUI startup: {:.3f}s'.format(self.windowShownTime))
+            print('{} import: {:.3f}s'.format(self.modelLoader.backend, self.modelLoader.importTime))
+            print('Model load: {:.3f}s'.format(self.modelLoader.loadTime))
+            print('Model warm-up: {:.3f}s'.format(self.modelLoader.warmUpTime))
+            QApplication.instance().quit()
+
+    @pyqtSlot(str)
+    def onModelFailed(self, message):
+        self.modelStatus.setText('| Model: unavailable')
+        self.modelStatus.setToolTip(message)
+
+        if self.reportStartupTime:
+            print('Model load failed: {}'.format(message))
+            QApplication.instance().quit()
+
+    @pyqtSlot(str)
+    def onSaveFinished(self, xmlName):
+        threading.Thread(target=self.__threadMessage, args=('{} saved!'.format(xmlName),), name='Thread-SavedMessage').start()
+
+    @pyqtSlot(str)
+    def onSaveFailed(self, message):
+        self.description.setText('Save failed: {}'.format(message))
+
+    def closeEvent(self, QCloseEvent):
+        # Pending xml writes and image moves are finished before the window goes away
+        if self.saveWriter.pendingCount > 0:
+            self.description.setText('Saving...')
+            Utils.changeCursor(Qt.WaitCursor)
+
+        # Stopped extractions may still be seeking or writing a frame, a running QThread must not be destroyed
+        self.__stopFrameExtraction()
+        for frameExtractor in self.findChildren(FrameExtractionWorker):
+            frameExtractor.stop()
+            frameExtractor.wait()
+
+        self.autoLabelExecutor.shutdown(wait=False, cancel_futures=True)
+        self.imagePrefetcher.close()
+        self.viewer.shutdown()
+        self.saveWriter.close()
+        stageTimer.disable()
+        super().closeEvent(QCloseEvent)
+
     def initialize(self):
+        self.cancelAutoLabel()
+        self.__stopFrameExtraction()
         self.labelComboBox.setCurrentIndex(0)
         self.changeBoxNum(0)
         self.pbarLoad.setValue(0)
@@ -709,11 +1062,15 @@ class Labeling(QMainWindow, MainUI):
             elif QKeyEvent.key() == Qt.Key_Shift:
                 self.viewer.mode = Mode.CORRECTION
                 self.viewer.mouseLineVisible = False
+            elif QKeyEvent.key() == Qt.Key_0:
+                self.viewer.resetZoom()
             self.__changeModeLabel(self.viewer.mode)
 
         if QKeyEvent.key() == Qt.Key_Delete:
             if self.viewer.mode == Mode.CORRECTION:
                 self.viewer.removeBoundingBox()
+        elif QKeyEvent.key() == Qt.Key_F12:
+            self.toggleStageStats()
 
         super().keyPressEvent(QKeyEvent)
 
@@ -729,6 +1086,27 @@ class Labeling(QMainWindow, MainUI):
                 self.__changeModeLabel(Mode.LABELING)
                 self.viewer.shiftFlag = True
 
+    def toggleStageStats(self):
+        if self.stageStats.isHidden():
+            stageTimer.enable()
+            self.updateStageStats()
+            self.stageStats.show()
+            self.stageStatsTimer.start(self.stageStatsInterval)
+        else:
+            self.stageStatsTimer.stop()
+            self.stageStats.hide()
+
+            if self.stageLogPath is None:
+                stageTimer.disable()
+
+    @pyqtSlot()
+    def updateStageStats(self):
+        stats = stageTimer.stats()
+        text = ' '.join('{} {:.0f}/{:.0f}ms'.format(stage, p50 * 1000, p95 * 1000)
+                        for stage, (_, p50, p95) in stats.items())
+
+        self.stageStats.setText('| {}'.format(text if text != '' else 'Stages: -'))
+
     @pyqtSlot(int)
     def changeBoxNum(self, num):
         self.boundingBoxNum.setText('| Box: {}'.format(num))
@@ -741,21 +1119,26 @@ class Labeling(QMainWindow, MainUI):
         if videoPath != '':
             self.initialize()
             self.viewer.initialize()
-            Utils.changeCursor(Qt.WaitCursor)
-            videoDir = self.__frame_extraction(videoPath)
-            self.__multiInputLoading(videoDir)
-            Utils.changeCursor(Qt.ArrowCursor)
+
+            videoName = os.path.basename(videoPath).split('.')[0]
+            videoDir = os.path.join(os.path.dirname(videoPath), videoName)
+            os.makedirs(videoDir, exist_ok=True)
+
+            # Frames are labeled while the rest of the video is still being extracted
+            self.__multiInputLoading(videoDir, streaming=True)
+            self.__startFrameExtraction(videoPath, videoDir)
 
     def openFileDialogue(self):
         imagePath, fileType = QFileDialog.getOpenFileName(self, 'Select Image', '', 'Image files {}'.format(self.allowImageType), options=QFileDialog.DontUseNativeDialog)
 
         if imagePath != '':
             self.getMultipleInput = False
-            rawImage = QImage(imagePath)
+            self.lookAhead.stop()
             self.initialize()
             self.viewer.initialize()
-            self.loadImage = ImageContainer(rawImage, imagePath)
-            self.viewer.setPixmap(QPixmap.fromImage(rawImage.scaled(self.viewer.width(), self.viewer.height())))
+            image, imageSize = decodeScaledImage(imagePath, (self.viewer.width(), self.viewer.height()))
+            self.loadImage = ImageContainer(image, imagePath, imageSize)
+            self.viewer.setImage(image, imagePath, imageSize)
 
     def openFolderDialogue(self):
         directory = QFileDialog.getExistingDirectory(self, 'Select Directory', options=QFileDialog.DontUseNativeDialog)
@@ -773,32 +1156,26 @@ class Labeling(QMainWindow, MainUI):
                 imageFullPath = os.path.join(self.imageSaveFolder, self.loadImage.fileName)
                 annotationFullPath = os.path.join(self.annotationSaveFolder, xmlName)
 
-                self.__saveToXml(annotationFullPath)
-                shutil.move(self.loadImage.filePath, imageFullPath)
-
-                threading.Thread(target=self.__threadMessage, args=('{} saved!'.format(xmlName),), name='Thread-SavedMessage').start()
+                # The xml is written and the image moved in the background, the next image is shown right away
+                self.saveWriter.submit(annotationFullPath, self.__annotation(), self.loadImage.filePath, imageFullPath)
 
+                self.cancelAutoLabel()
                 self.currentIdx += 1
+                self.lookAhead.advance(self.currentIdx)
                 if self.currentIdx < len(self.imagePaths):
                     self.labelComboBox.setCurrentIndex(0)
                     self.changeBoxNum(0)
                     self.viewer.initialize()
-                    rawImage = QImage(self.imagePaths[self.currentIdx])
-                    self.loadImage = ImageContainer(rawImage, self.imagePaths[self.currentIdx])
-                    self.viewer.setPixmap(QPixmap.fromImage(self.loadImage.image.scaled(self.viewer.width(), self.viewer.height())))
-                    self.imageIdx.setText('{}/{}'.format(self.currentIdx+1, len(self.imagePaths)))
-                    self.pbarLoad.setValue((self.currentIdx+1) * (100 / len(self.imagePaths)))
-                else:
-                    self.getMultipleInput = False
-                    self.currentIdx = 0
-                    self.loadImage = None
-
-                    pixmap = QPixmap(self.viewer.width(), self.viewer.height())
-                    pixmap.fill(QColor(Qt.gray))
-                    self.viewer.setPixmap(pixmap)
-
-                    self.initialize()
+                    self.__loadSessionImage(self.currentIdx)
+                    self.__updateSessionIndex()
+                elif self.frameExtractor is not None:
+                    # onFrameExtracted shows the next frame as soon as it is written
+                    self.labelComboBox.setCurrentIndex(0)
+                    self.changeBoxNum(0)
                     self.viewer.initialize()
+                    self.__waitForFrames()
+                else:
+                    self.__endMultiInputSession()
 
         elif not self.getMultipleInput:
             if self.loadImage is not None:
@@ -809,30 +1186,70 @@ class Labeling(QMainWindow, MainUI):
                     if savePath.split('/')[-1].split('.')[-1] != 'xml':
                         savePath += '.xml'
 
-                    self.__saveToXml(savePath)
+                    self.saveWriter.submit(savePath, self.__annotation())
 
-                    pixmap = QPixmap(self.viewer.width(), self.viewer.height())
-                    pixmap.fill(QColor(Qt.gray))
-                    self.viewer.setPixmap(pixmap)
+                    self.viewer.clearImage()
 
                     self.initialize()
                     self.viewer.initialize()
 
     def autoLabel(self):
         if self.loadImage is not None:
-            Utils.changeCursor(Qt.WaitCursor)
-            image = load_image(self.loadImage.filePath)
-            boundingBoxes = prediction(image, self.yolo)
+            self.cancelAutoLabel()
+            imagePath = self.loadImage.filePath
+            proposal = self.lookAhead.proposal(imagePath)
 
-            for box in boundingBoxes:
-                oldH, oldW, _ = image.shape
-                newH, newW = self.viewer.height(), self.viewer.width()
-                box[:] = [box[0]*newW/oldW, box[1]*newH/oldH, box[2]*newW/oldW, box[3]*newH/oldH]
+            if proposal is not None:
+                self.__showProposal(proposal)
+            else:
+                self.description.setText('Auto labeling...')
+                self.autoLabelFuture = self.autoLabelExecutor.submit(self.__detect, self.autoLabelRequest, imagePath)
+
+    def cancelAutoLabel(self):
+        # A running detection can not be interrupted, its result is dropped as stale when it arrives
+        self.autoLabelRequest += 1
+
+        if self.autoLabelFuture is not None:
+            self.autoLabelFuture.cancel()
+            self.autoLabelFuture = None
+            self.description.setText('')
+
+    @pyqtSlot(int, str, object)
+    def onAutoLabelFinished(self, requestId, imagePath, proposal):
+        if self.__isCurrentRequest(requestId, imagePath):
+            self.autoLabelFuture = None
+            self.description.setText('')
+            self.__showProposal(proposal)
+
+    @pyqtSlot(int, str, str)
+    def onAutoLabelFailed(self, requestId, imagePath, message):
+        if self.__isCurrentRequest(requestId, imagePath):
+            self.autoLabelFuture = None
+            self.description.setText('AutoLabel failed: {}'.format(message))
+
+    def __isCurrentRequest(self, requestId, imagePath):
+        return requestId == self.autoLabelRequest and self.loadImage is not None and \
+            self.loadImage.filePath == imagePath
+
+    def __detect(self, requestId, imagePath):
+        # Runs on the auto label worker thread, results are posted back to the GUI thread through signals
+        try:
+            proposal = self.lookAhead.detect(imagePath)
+        except Exception as e:
+            self.autoLabelFailed.emit(requestId, imagePath, str(e))
+        else:
+            self.autoLabelFinished.emit(requestId, imagePath, proposal)
 
-            self.viewer.autoLabeling(boundingBoxes)
-            Utils.changeCursor(Qt.ArrowCursor)
+    def __showProposal(self, proposal):
+        boundingBoxes, (oldH, oldW) = proposal
+        boundingBoxes = [list(box) for box in boundingBoxes]
 
-    def __multiInputLoading(self, dir):
+        for box in boundingBoxes:
+            box[:] = [box[0]/oldW, box[1]/oldH, box[2]/oldW, box[3]/oldH]
+
+        self.viewer.autoLabeling(boundingBoxes)
+
+    def __multiInputLoading(self, dir, streaming=False):
         self.imageSaveFolder = os.path.join(dir, 'image')
         self.annotationSaveFolder = os.path.join(dir, 'annotation')
         os.makedirs(self.imageSaveFolder, exist_ok=True)
@@ -841,7 +1258,7 @@ class Labeling(QMainWindow, MainUI):
         self.getMultipleInput = True
         self.imagePaths = globWithTypes(dir, ['png', 'jpg', 'jpeg'])
 
-        if len(self.imagePaths) < 1:
+        if len(self.imagePaths) < 1 and not streaming:
             threading.Thread(target=self.__threadMessage, args=('Images not exist in {}'.format(dir),),
                              name='Thread-NoImageExist').start()
             return
@@ -850,29 +1267,119 @@ class Labeling(QMainWindow, MainUI):
         self.viewer.initialize()
 
         self.currentIdx = 0
-        self.loadImage = ImageContainer(QImage(self.imagePaths[self.currentIdx]),
-                                        self.imagePaths[self.currentIdx])
-        self.viewer.setPixmap(QPixmap.fromImage(self.loadImage.image.scaled(self.viewer.width(), self.viewer.height())))
-
+        self.lookAhead.start(self.imagePaths, self.currentIdx)
+        self.imagePrefetcher.clear()
         self.remainingNotification.show()
-        self.imageIdx.setText('{}/{}'.format(1, len(self.imagePaths)))
-        self.pbarLoad.setValue(1 * (100 / len(self.imagePaths)))
+
+        if len(self.imagePaths) > 0:
+            self.__loadSessionImage(self.currentIdx)
+            self.__updateSessionIndex()
+        else:
+            self.__waitForFrames()
+
+    def __endMultiInputSession(self):
+        self.getMultipleInput = False
+        self.currentIdx = 0
+        self.loadImage = None
+        self.lookAhead.stop()
+        self.imagePrefetcher.clear()
+
+        self.viewer.clearImage()
+
+        self.initialize()
+        self.viewer.initialize()
+
+    def __waitForFrames(self):
+        self.loadImage = None
+
+        self.viewer.clearImage()
+
+    def __updateSessionIndex(self):
+        total = len(self.imagePaths)
+        extracting = '+' if self.frameExtractor is not None else ''
+
+        self.imageIdx.setText('{}/{}{}'.format(min(self.currentIdx + 1, total), total, extracting))
+        self.pbarLoad.setValue(int(min(self.currentIdx + 1, total) * 100 / max(total, 1)))
+
+    def __startFrameExtraction(self, videoPath, destinationPath):
+        self.description.setText('Frame extraction ')
+        self.pbar.show()
+        self.pbar.setValue(0)
+
+        self.frameExtractor = FrameExtractionWorker(videoPath, destinationPath,
+                                                    ratio=self.frameSamplingRatio,
+                                                    strategy=self.frameSamplingStrategy,
+                                                    parent=self)
+        self.frameExtractor.frameExtracted.connect(self.onFrameExtracted)
+        self.frameExtractor.progressChanged.connect(self.onFrameExtractionProgress)
+        self.frameExtractor.finished.connect(self.onFrameExtractionFinished)
+        self.frameExtractor.finished.connect(self.frameExtractor.deleteLater)
+        self.frameExtractor.start()
+
+    def __stopFrameExtraction(self):
+        # Frames of a stopped extraction that are still queued are ignored by the slots below
+        if self.frameExtractor is not None:
+            self.frameExtractor.stop()
+            self.frameExtractor = None
+            self.description.setText('')
+            self.pbar.hide()
+
+    @pyqtSlot(str)
+    def onFrameExtracted(self, framePath):
+        if self.sender() is not self.frameExtractor or framePath in self.imagePaths[self.currentIdx:]:
+            return
+
+        self.imagePaths.append(framePath)
+        self.lookAhead.append([framePath])
+
+        if self.loadImage is None:
+            self.__loadSessionImage(self.currentIdx)
+        elif len(self.imagePaths) - 1 <= self.currentIdx + self.imagePrefetchDepth:
+            self.imagePrefetcher.prefetch([framePath], (self.viewer.width(), self.viewer.height()))
+
+        self.__updateSessionIndex()
+
+    @pyqtSlot(int, int)
+    def onFrameExtractionProgress(self, done, total):
+        if self.sender() is self.frameExtractor:
+            self.pbar.setValue(int(done * 100 / total))
+
+    @pyqtSlot()
+    def onFrameExtractionFinished(self):
+        if self.sender() is not self.frameExtractor:
+            return
+
+        self.frameExtractor = None
+        self.description.setText('')
+        self.pbar.hide()
+
+        if self.getMultipleInput and self.loadImage is None:
+            self.__endMultiInputSession()
+        elif self.getMultipleInput:
+            self.__updateSessionIndex()
+
+    def __loadSessionImage(self, idx):
+        viewerSize = (self.viewer.width(), self.viewer.height())
+        image, imageSize = self.imagePrefetcher.get(self.imagePaths[idx], viewerSize)
+
+        self.loadImage = ImageContainer(image, self.imagePaths[idx], imageSize)
+        self.viewer.setImage(image, self.imagePaths[idx], imageSize)
+        self.imagePrefetcher.prefetch(self.imagePaths[idx + 1:idx + 1 + self.imagePrefetchDepth], viewerSize)
 
     def __threadMessage(self, message):
         self.description.setText(message)
         time.sleep(2)
         self.description.setText('')
 
-    def __saveToXml(self, filePath):
+    def __annotation(self):
+        # Plain data taken by write_annotation_xml, so that the xml can be built off the GUI thread
         bndBox = self.viewer.boxes
-        annotation = xml_root(self.loadImage.fileName, self.loadImage.imageHeight, self.loadImage.imageWidth)
-
         instances = []
 
         for box in bndBox:
-            xmin, ymin, width, height, label = box
-            positionRatio = (xmin/self.viewer.width(), ymin/self.viewer.height())
-            scaleRatio = (width/self.viewer.width(), height/self.viewer.height())
+            xminRatio, yminRatio, widthRatio, heightRatio, label = box
+            positionRatio = (xminRatio, yminRatio)
+            scaleRatio = (widthRatio, heightRatio)
 
             bboxXmin = self.loadImage.imageWidth * positionRatio[0]
             bboxYmin = self.loadImage.imageHeight * positionRatio[1]
@@ -887,9 +1394,10 @@ class Labeling(QMainWindow, MainUI):
             instances.append({'bbox': [bboxXmin, bboxYmin, bboxXmax, bboxYmax],
                               'category_id': label.value})
 
-        for instance in instances:
-            annotation.append(instance_to_xml(instance))
-        etree.ElementTree(annotation).write(filePath)
+        return {'filename': self.loadImage.fileName,
+                'height': self.loadImage.imageHeight,
+                'width': self.loadImage.imageWidth,
+                'instances': instances}
 
     def __changeModeLabel(self, mode):
         if mode == Mode.CORRECTION:
@@ -899,43 +1407,25 @@ class Labeling(QMainWindow, MainUI):
             self.notification.setText(Mode.LABELING.name)
             self.notification.setStyleSheet('QWidget { background-color: %s }' % (QColor(0, 255, 0).name()))
 
-    def __frame_extraction(self, video_path):
-        video_name = os.path.basename(video_path).split('.')[0]
-        video_directory = os.path.dirname(video_path)
-        destination_path = os.path.join(video_directory, video_name)
-        os.makedirs(destination_path, exist_ok=True)
-
-        self.description.setText('Frame extraction ')
-        self.pbar.show()
-        self.pbar.setValue(0)
-
-        cnt = 0
-        cap = cv2.VideoCapture(video_path)
-        length = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        data_length = int(0.05 * length)
-        using_idx = np.array(random.sample(range(length), data_length))
-
-        while cap.isOpened():
-            ret, frame = cap.read()
-
-            if ret:
-                if cnt in using_idx:
-                    Image.fromarray(frame[..., ::-1]).save(os.path.join(destination_path, '{}_{}.jpg'.format(video_name, cnt)))
-                cnt += 1
-                percent = (cnt + 1) / length * 100
-                self.pbar.setValue(percent)
-            else:
-                break
-
-        cap.release()
-
-        self.description.setText('')
-        self.pbar.hide()
-
-        return destination_path
-
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    w = Labeling()
+    parser = argparse.ArgumentParser(description=AppString.TITLE.value)
+    parser.add_argument('--startup-time', action='store_true',
+                        help='report GUI startup, inference runtime import, model load and warm-up time, then exit')
+    parser.add_argument('--backend', choices=BACKENDS, default='keras',
+                        help='onnx runs the detector with ONNX Runtime, converting the .h5 model on first use')
+    parser.add_argument('--threads', type=int, default=None, help='intra-op threads of the inference backend')
+    parser.add_argument('--annotation-db', default=None,
+                        help='save annotations into this SQLite database instead of VOC xml files, '
+                             'export them with annotation_store.py')
+    parser.add_argument('--stage-stats', action='store_true',
+                        help='show the p50/p95 time of every stage in the status bar (toggled with F12)')
+    parser.add_argument('--stage-log', default=None,
+                        help='append every stage time to this JSON lines file')
+    args, qtArgs = parser.parse_known_args()
+
+    app = QApplication(sys.argv[:1] + qtArgs)
+    w = Labeling(reportStartupTime=args.startup_time, annotationDatabasePath=args.annotation_db,
+                 showStageStats=args.stage_stats, stageLogPath=args.stage_log,
+                 inferenceBackend=args.backend, inferenceThreads=args.threads)
     sys.exit(app.exec_())
@@ -0,0 +1,72 @@
+import threading
+import time
+
+from inference_backend import create_backend
+
+
+class ModelLoader:
+    # Imports the inference runtime and loads the detector on first use, or ahead of time in a background thread.
+    # model is an inference_backend backend (Keras by default), already warmed up with one zero batch.
+
+    def __init__(self, modelPath, onReady=None, onError=None, backend='keras', intraOpThreads=None,
+                 interOpThreads=None):
+        self.__modelPath = modelPath
+        self.__backend = backend
+        self.__intraOpThreads = intraOpThreads
+        self.__interOpThreads = interOpThreads
+        self.__onReady = onReady
+        self.__onError = onError
+        self.__model = None
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.importTime = None
+        self.loadTime = None
+        self.warmUpTime = None
+
+    @property
+    def modelPath(self):
+        return self.__modelPath
+
+    @property
+    def backend(self):
+        return self.__backend
+
+    @property
+    def isReady(self):
+        return self.__model is not None
+
+    @property
+    def model(self):
+        with self.__lock:
+            if self.__model is None:
+                self.__load()
+
+        return self.__model
+
+    def warmUp(self):
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__warmUp, name='Thread-ModelWarmUp', daemon=True)
+            self.__thread.start()
+
+    def __warmUp(self):
+        try:
+            self.model
+        except Exception as e:
+            # Loading is retried, and the error raised, on the next use of the model
+            if self.__onError is not None:
+                self.__onError(str(e))
+
+    def __load(self):
+        model = create_backend(self.__backend, self.__modelPath, self.__intraOpThreads, self.__interOpThreads)
+        model.load()
+        self.importTime = model.import_time
+        self.loadTime = model.load_time
+
+        startTime = time.perf_counter()
+        model.warm_up()
+        self.warmUpTime = time.perf_counter() - startTime
+
+        self.__model = model
+
+        if self.__onReady is not None:
+            self.__onReady()
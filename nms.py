@@ -0,0 +1,54 @@
+import numpy as np
+
+
+def iou_matrix(boxes_a, boxes_b):
+    boxes_a = np.reshape(boxes_a, (-1, 4))
+    boxes_b = np.reshape(boxes_b, (-1, 4))
+
+    intersect_w = np.minimum(boxes_a[:, np.newaxis, 2], boxes_b[np.newaxis, :, 2]) - \
+        np.maximum(boxes_a[:, np.newaxis, 0], boxes_b[np.newaxis, :, 0])
+    intersect_h = np.minimum(boxes_a[:, np.newaxis, 3], boxes_b[np.newaxis, :, 3]) - \
+        np.maximum(boxes_a[:, np.newaxis, 1], boxes_b[np.newaxis, :, 1])
+
+    intersect = np.maximum(intersect_w, 0) * np.maximum(intersect_h, 0)
+
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+
+    union = area_a[:, np.newaxis] + area_b[np.newaxis, :] - intersect
+
+    return intersect / union
+
+
+def non_max_suppression(boxes, scores, iou_threshold=0.3, class_ids=None, max_detections=None):
+    # Greedy NMS over (xmin, ymin, xmax, ymax) boxes. When class_ids is given, boxes of each class are shifted
+    # by a class dependent offset so that boxes of different classes never overlap and never suppress each other.
+    # Returns the indices of the kept boxes, highest score first.
+    boxes = np.reshape(np.asarray(boxes), (-1, 4))
+    scores = np.asarray(scores)
+
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    if class_ids is not None:
+        offsets = np.asarray(class_ids) * (boxes.max() - boxes.min() + 1)
+        boxes = boxes + offsets[:, np.newaxis].astype(boxes.dtype)
+
+    order = np.argsort(scores)[::-1]
+    ious = iou_matrix(boxes[order], boxes[order])
+
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+
+        keep.append(i)
+
+        if max_detections is not None and len(keep) >= max_detections:
+            break
+
+        suppressed[i + 1:] |= ious[i, i + 1:] >= iou_threshold
+
+    return order[keep]
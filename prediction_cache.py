@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+# Shared by the labeling tool and auto_label.py, so that proposals made by either are reused by the other
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ImageLabelingTool', 'predictions')
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    # Detector proposals stored on disk, one .npz per (image content, model, inference backend, prediction config)
+    # key. Backends round differently, so Keras and ONNX proposals are kept apart.
+    # The least recently used entries are evicted once the cache grows over max_bytes.
+
+    def __init__(self, cache_dir, model_path, max_bytes=DEFAULT_CACHE_SIZE, backend='keras'):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.model_path = model_path
+        self.backend = backend
+
+        self.__lock = threading.Lock()
+        self.__model_fingerprint = None
+        self.__entries = {}
+        self.__total_bytes = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.__scan()
+
+    @property
+    def model_fingerprint(self):
+        # Hashing a large .h5 takes a while, so it is done on the first lookup instead of at startup
+        with self.__lock:
+            if self.__model_fingerprint is None:
+                self.__model_fingerprint = file_digest(self.model_path)
+
+        return self.__model_fingerprint
+
+    def key(self, image_path, config):
+        digest = hashlib.sha1()
+        digest.update(file_digest(image_path).encode())
+        digest.update(self.model_fingerprint.encode())
+        digest.update(self.backend.encode())
+        digest.update(json.dumps(config, sort_keys=True).encode())
+
+        return digest.hexdigest()
+
+    def get(self, key):
+        path = self.__entry_path(key)
+
+        with self.__lock:
+            if key not in self.__entries:
+                return None
+
+            try:
+                with np.load(path) as entry:
+                    boxes, shape = entry['boxes'], tuple(int(v) for v in entry['shape'])
+                os.utime(path)
+            except (OSError, ValueError, KeyError):
+                self.__remove(key)
+                return None
+
+            self.__entries[key] = (os.path.getmtime(path), self.__entries[key][1])
+
+        return boxes.tolist(), shape
+
+    def put(self, key, boxes, shape):
+        path = self.__entry_path(key)
+        # Per process, the labeling tool and auto_label.py workers may write the same entry at once
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+
+        with self.__lock:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, boxes=np.reshape(np.asarray(boxes, dtype=np.int64), (-1, 4)), shape=np.asarray(shape))
+            os.replace(tmp_path, path)
+
+            if key in self.__entries:
+                self.__total_bytes -= self.__entries[key][1]
+
+            size = os.path.getsize(path)
+            self.__entries[key] = (os.path.getmtime(path), size)
+            self.__total_bytes += size
+
+            if self.__total_bytes > self.max_bytes:
+                self.__evict()
+
+    def clear(self):
+        with self.__lock:
+            for key in list(self.__entries):
+                self.__remove(key)
+
+    def __entry_path(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def __scan(self):
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith('.npz'):
+                stat = entry.stat()
+                self.__entries[entry.name[:-len('.npz')]] = (stat.st_mtime, stat.st_size)
+                self.__total_bytes += stat.st_size
+
+    def __evict(self):
+        # Drop down to 90% of the budget so that the next few puts do not evict again
+        target = self.max_bytes * 0.9
+
+        for key in sorted(self.__entries, key=lambda k: self.__entries[k][0]):
+            if self.__total_bytes <= target:
+                break
+            self.__remove(key)
+
+    def __remove(self, key):
+        _, size = self.__entries.pop(key)
+        self.__total_bytes -= size
+
+        try:
+            os.remove(self.__entry_path(key))
+        except FileNotFoundError:
+            pass
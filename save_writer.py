@@ -0,0 +1,133 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from stage_timer import timer
+from utils import write_annotation_xml, move_file
+
+
+class SaveWriter:
+    # Writes annotation xml files and moves saved images on one background thread, in the order they were
+    # submitted, so that the annotator gets the next image right away. onSaved/onError are called from that thread.
+    # With an AnnotationStore the annotations go to its database instead of xml files, committed once the queue
+    # runs empty or a batch is full: the save that leaves no other save queued behind it flushes the store, so a
+    # partial batch is always committed before the writer goes idle. Their images are only moved, and onSaved only
+    # called, once the commit holding them succeeded. A failed commit reports every annotation it held, they are
+    # committed again with the next save.
+
+    def __init__(self, onSaved=None, onError=None, store=None):
+        self.__store = store
+        self.__onSaved = onSaved
+        self.__onError = onError
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='Thread-SaveWriter')
+        self.__lock = threading.Lock()
+        self.__pending = set()
+        # Saves submitted but not started by the writer thread yet
+        self.__queued = 0
+        # (annotationPath, imagePath, imageDestination) put into the store but not committed yet, writer thread only
+        self.__uncommitted = []
+
+    @property
+    def pendingCount(self):
+        with self.__lock:
+            return len(self.__pending)
+
+    def submit(self, annotationPath, annotation, imagePath=None, imageDestination=None):
+        # annotation is the dict taken by write_annotation_xml, imagePath is moved to imageDestination after it
+        with self.__lock:
+            self.__queued += 1
+
+        future = self.__executor.submit(self.__save, annotationPath, annotation, imagePath, imageDestination)
+
+        with self.__lock:
+            self.__pending.add(future)
+
+        future.add_done_callback(self.__done)
+
+    def flush(self):
+        with self.__lock:
+            pending = list(self.__pending)
+
+        wait(pending)
+
+    def close(self):
+        self.flush()
+
+        if self.__store is not None:
+            # Last try for annotations of failed commits
+            self.__executor.submit(self.__commitStore, self.__closeStore).result()
+
+        self.__executor.shutdown()
+
+    def __done(self, future):
+        with self.__lock:
+            self.__pending.discard(future)
+
+    def __save(self, annotationPath, annotation, imagePath, imageDestination):
+        # Counted before the save is submitted, a save submitted after this check runs and flushes after this one
+        with self.__lock:
+            self.__queued -= 1
+            lastQueued = self.__queued == 0
+
+        if self.__store is None:
+            try:
+                with timer.stage('save annotation'):
+                    write_annotation_xml(annotationPath, **annotation)
+            except Exception as e:
+                self.__reportError(annotationPath, e)
+            else:
+                self.__finish(annotationPath, imagePath, imageDestination)
+            return
+
+        self.__uncommitted.append((annotationPath, imagePath, imageDestination))
+
+        def put():
+            # True when the annotations are in the database, False when the store only buffered this one
+            if self.__store.put(os.path.dirname(annotationPath), os.path.basename(annotationPath), **annotation):
+                return True
+
+            if lastQueued:
+                self.__store.flush()
+                return True
+
+            return False
+
+        self.__commitStore(put)
+
+    def __commitStore(self, commit):
+        # commit returns whether it committed. Every annotation put before a successful commit is in the database,
+        # their images can be moved now. Buffered ones stay uncommitted until a later commit.
+        try:
+            with timer.stage('save annotation'):
+                committed = commit()
+        except Exception as e:
+            for annotationPath, _, _ in self.__uncommitted:
+                self.__reportError(annotationPath, 'not saved yet, retried with the next save ({})'.format(e))
+            return
+
+        if not committed:
+            return
+
+        committed, self.__uncommitted = self.__uncommitted, []
+
+        for annotationPath, imagePath, imageDestination in committed:
+            self.__finish(annotationPath, imagePath, imageDestination)
+
+    def __closeStore(self):
+        self.__store.close()
+        return True
+
+    def __finish(self, annotationPath, imagePath, imageDestination):
+        try:
+            if imagePath is not None:
+                with timer.stage('move image'):
+                    move_file(imagePath, imageDestination)
+        except Exception as e:
+            self.__reportError(annotationPath, e)
+        else:
+            if self.__onSaved is not None:
+                self.__onSaved(os.path.basename(annotationPath))
+
+    def __reportError(self, annotationPath, error):
+        if self.__onError is not None:
+            self.__onError('{}: {}'.format(os.path.basename(annotationPath), error))
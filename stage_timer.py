@@ -0,0 +1,102 @@
+import json
+import math
+import threading
+import time
+from collections import deque
+
+
+class _NullTiming:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMING = _NullTiming()
+
+
+class _Timing:
+    __slots__ = ('timer', 'stage', 'start')
+
+    def __init__(self, timer, stage):
+        self.timer = timer
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.record(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class StageTimer:
+    # Wall times of the hot path stages (image decode, model.predict, xml save, ...) over the last window samples
+    # of each stage, optionally appended to a JSON lines log. Stages may be timed from any thread. While disabled,
+    # stage() returns a shared no-op context manager, so the instrumented code only pays for one attribute check.
+
+    def __init__(self, window=200):
+        self.window = window
+        self.enabled = False
+        self.__lock = threading.Lock()
+        self.__samples = {}
+        self.__log = None
+
+    def enable(self, logPath=None):
+        with self.__lock:
+            if logPath is not None and self.__log is None:
+                self.__log = open(logPath, 'a', buffering=1)
+
+            self.enabled = True
+
+    def disable(self):
+        # The samples are kept, so that the stats are still there when timing is enabled again
+        with self.__lock:
+            self.enabled = False
+
+            if self.__log is not None:
+                self.__log.close()
+                self.__log = None
+
+    def stage(self, name):
+        # with timer.stage('predict'): ...
+        return _Timing(self, name) if self.enabled else _NULL_TIMING
+
+    def record(self, name, seconds):
+        with self.__lock:
+            if not self.enabled:
+                return
+
+            samples = self.__samples.get(name)
+
+            if samples is None:
+                samples = self.__samples[name] = deque(maxlen=self.window)
+
+            samples.append(seconds)
+
+            if self.__log is not None:
+                self.__log.write(json.dumps({'time': time.time(), 'stage': name, 'seconds': seconds}) + '\n')
+
+    def stats(self):
+        # {stage: (sample count, p50, p95)} in seconds, stages in the order they were first timed
+        with self.__lock:
+            samples = {name: sorted(values) for name, values in self.__samples.items()}
+
+        return {name: (len(values), percentile(values, 50), percentile(values, 95))
+                for name, values in samples.items() if len(values) > 0}
+
+    def reset(self):
+        with self.__lock:
+            self.__samples.clear()
+
+
+def percentile(sortedValues, q):
+    # Nearest rank percentile of an already sorted list
+    rank = math.ceil(q / 100 * len(sortedValues))
+    return sortedValues[max(0, min(rank, len(sortedValues)) - 1)]
+
+
+# The one timer of the process, shared by every instrumented module
+timer = StageTimer()
@@ -0,0 +1,106 @@
+import os
+
+from annotation_index import AnnotationIndex
+from utils import parse_annotation
+
+LABELS = ['Ship', 'Buoy']
+
+ANNOTATIONS = {
+    'a.xml': '''<annotation>
+    <filename>a.jpg</filename>
+    <size><width>640</width><height>480</height></size>
+    <object><name>Ship</name><bndbox><xmin>10.4</xmin><ymin>20</ymin><xmax>110.6</xmax><ymax>220</ymax></bndbox></object>
+    <!-- a comment -->
+    <object><name>Other</name><bndbox><xmin>1</xmin><ymin>2</ymin><xmax>3</xmax><ymax>4</ymax></bndbox></object>
+</annotation>''',
+    'b.xml': '''<annotation>
+    <filename>b.jpg</filename>
+    <object>
+        <name>Buoy</name>
+        <bndbox><xmin>5</xmin><ymin>6</ymin></bndbox>
+        <part><name>Ship</name><bndbox><xmin>7</xmin><ymin>8</ymin><xmax>9</xmax><ymax>10</ymax></bndbox></part>
+    </object>
+</annotation>''',
+    'c.xml': '''<annotation>
+    <filename>c.jpg</filename>
+    <size><width>320</width><height>240</height></size>
+    <object><name>Other</name><bndbox><xmin>1</xmin><ymin>2</ymin><xmax>3</xmax><ymax>4</ymax></bndbox></object>
+</annotation>''',
+    'd.xml': '''<annotation>
+    <filename>d.jpg</filename>
+    <size><width>320</width><height>240</height></size>
+</annotation>''',
+}
+
+
+def write_annotations(ann_dir, annotations=ANNOTATIONS):
+    os.makedirs(ann_dir, exist_ok=True)
+
+    for name, xml in annotations.items():
+        with open(os.path.join(ann_dir, name), 'w') as f:
+            f.write(xml)
+
+
+def assert_matches_parse_annotation(index, ann_dir, img_dir):
+    all_imgs, seen_labels = parse_annotation(ann_dir, img_dir, LABELS, 'test')
+
+    assert index.records(img_dir, LABELS) == all_imgs
+    assert list(index.seen_labels().items()) == list(seen_labels.items())
+
+
+def test_records_match_parse_annotation(tmp_path):
+    ann_dir, img_dir = str(tmp_path / 'annotation'), str(tmp_path / 'image')
+    write_annotations(ann_dir)
+    index = AnnotationIndex(ann_dir)
+
+    assert index.refresh() == 4 and len(index) == 4
+    assert_matches_parse_annotation(index, ann_dir, img_dir)
+    assert os.path.exists(str(tmp_path / 'annotation.index.npz'))
+
+    # Loaded back from the .npz, nothing to re-parse
+    index = AnnotationIndex(ann_dir)
+
+    assert index.refresh() == 0
+    assert_matches_parse_annotation(index, ann_dir, img_dir)
+
+
+def test_refresh_only_parses_changed_files(tmp_path):
+    ann_dir, img_dir = str(tmp_path / 'annotation'), str(tmp_path / 'image')
+    write_annotations(ann_dir)
+    index = AnnotationIndex(ann_dir)
+    index.refresh()
+
+    write_annotations(ann_dir, {'c.xml': ANNOTATIONS['c.xml'].replace('Other', 'Buoy')})
+    stat = os.stat(os.path.join(ann_dir, 'c.xml'))
+    os.utime(os.path.join(ann_dir, 'c.xml'), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    assert index.refresh() == 1
+    assert_matches_parse_annotation(index, ann_dir, img_dir)
+
+    # Same size, only the mtime tells the file changed
+    write_annotations(ann_dir, {'c.xml': ANNOTATIONS['c.xml'].replace('Other', 'Ship')})
+    os.utime(os.path.join(ann_dir, 'c.xml'), ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10 ** 9))
+
+    assert index.refresh() == 1
+    assert_matches_parse_annotation(index, ann_dir, img_dir)
+    assert 'Buoy' not in [obj["name"] for img in index.records(img_dir, LABELS) if img["filename"].endswith('c.jpg')
+                          for obj in img["object"]]
+
+
+def test_deleted_files_are_dropped(tmp_path):
+    ann_dir, img_dir = str(tmp_path / 'annotation'), str(tmp_path / 'image')
+    write_annotations(ann_dir)
+    index = AnnotationIndex(ann_dir)
+    index.refresh()
+
+    os.remove(os.path.join(ann_dir, 'a.xml'))
+
+    assert index.refresh() == 0 and len(index) == 3
+    assert_matches_parse_annotation(index, ann_dir, img_dir)
+    assert 'Other' in index.seen_labels()
+
+    os.remove(os.path.join(ann_dir, 'c.xml'))
+    index.refresh()
+
+    assert_matches_parse_annotation(index, ann_dir, img_dir)
+    assert 'Other' not in index.seen_labels()
@@ -0,0 +1,49 @@
+import sqlite3
+
+import pytest
+
+from annotation_store import SCHEMA, AnnotationStore
+
+
+def annotation(filename, boxes=1):
+    return {'filename': filename,
+            'height': 480,
+            'width': 640,
+            'instances': [{'bbox': [10 * idx, 20, 10 * idx + 5, 40], 'category_id': 'Ship'} for idx in range(boxes)]}
+
+
+def test_saved_annotations_round_trip(tmp_path):
+    store = AnnotationStore(str(tmp_path / 'annotations.db'), batch_size=2)
+
+    assert store.put('session', 'a.xml', **annotation('a.jpg')) is False
+    assert store.put('session', 'b.xml', **annotation('b.jpg', 2)) is True
+    store.put('session', 'a.xml', **annotation('a.jpg', 3))
+    store.flush()
+
+    saved = {xml_name: value for _, xml_name, value in store.annotations()}
+    assert saved == {'a.xml': annotation('a.jpg', 3), 'b.xml': annotation('b.jpg', 2)}
+    store.close()
+
+
+def test_failed_commit_keeps_the_batch(tmp_path):
+    db_path = str(tmp_path / 'annotations.db')
+    store = AnnotationStore(db_path, batch_size=10)
+    store.put('session', 'a.xml', **annotation('a.jpg'))
+    store.put('session', 'b.xml', **annotation('b.jpg'))
+
+    broken = sqlite3.connect(db_path)
+    broken.execute('DROP TABLE boxes')
+    broken.commit()
+
+    with pytest.raises(sqlite3.Error):
+        store.flush()
+
+    assert store.pending_count == 2
+
+    broken.executescript(SCHEMA)
+    broken.close()
+    store.flush()
+
+    assert store.pending_count == 0
+    assert sorted(xml_name for _, xml_name, _ in store.annotations()) == ['a.xml', 'b.xml']
+    store.close()
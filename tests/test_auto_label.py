@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+import auto_label
+from prediction_cache import PredictionCache
+from utils import prediction_config
+
+
+class FailingLoader:
+    @property
+    def model(self):
+        raise AssertionError('the model is loaded although every image is cached')
+
+
+def test_label_batch_reuses_the_shared_cache(tmp_path, monkeypatch):
+    model_path = str(tmp_path / 'model.h5')
+    with open(model_path, 'wb') as f:
+        f.write(b'weights')
+
+    image_path = str(tmp_path / 'frame_1.jpg')
+    Image.fromarray(np.zeros((120, 160, 3), dtype=np.uint8)).save(image_path)
+
+    # Written like the labeling tool's look-ahead writes it
+    cache_dir = str(tmp_path / 'cache')
+    cache = PredictionCache(cache_dir, model_path)
+    cache.put(cache.key(image_path, prediction_config()), [[10, 20, 30, 40]], (120, 160))
+
+    auto_label.init_worker(model_path, cache_dir=cache_dir)
+    monkeypatch.setattr(auto_label, '_model_loader', FailingLoader())
+
+    annotation_dir = str(tmp_path / 'annotation')
+    os.makedirs(annotation_dir)
+
+    assert auto_label.label_batch([image_path], annotation_dir) == (1, [])
+
+    with open(os.path.join(annotation_dir, 'frame_1.xml')) as f:
+        xml = f.read()
+
+    assert '<xmin>10</xmin>' in xml and '<ymax>60</ymax>' in xml
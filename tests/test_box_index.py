@@ -0,0 +1,69 @@
+import random
+
+from box_index import BoxGridIndex
+
+
+def contains(rect, x, y):
+    # Half-open like the viewer's mouse hit tests
+    bx, by, w, h = rect
+    return bx <= x < bx + w and by <= y < by + h
+
+
+def test_query_is_a_superset_of_the_containing_boxes():
+    rng = random.Random(0)
+    index = BoxGridIndex(cellSize=16)
+    rects = {}
+
+    for box in range(200):
+        rects[box] = (rng.randrange(-50, 300), rng.randrange(-50, 300), rng.randrange(0, 80), rng.randrange(0, 80))
+        index.insert(box, *rects[box])
+
+    assert len(index) == 200
+
+    for _ in range(2000):
+        x, y = rng.randrange(-60, 400), rng.randrange(-60, 400)
+        containing = {box for box, rect in rects.items() if contains(rect, x, y)}
+
+        assert containing <= set(index.query(x, y))
+
+
+def test_moved_box_leaves_its_old_cells():
+    index = BoxGridIndex(cellSize=10)
+    index.insert('box', 5, 5, 10, 10)
+
+    # Cells (0, 0) to (1, 1), the right and bottom edges at 15 are exclusive so it stops before the cells at 20
+    assert 'box' in index.query(5, 5) and 'box' in index.query(19, 19)
+    assert 'box' not in index.query(20, 5) and 'box' not in index.query(5, 20)
+
+    index.insert('box', 25, 5, 10, 10)
+
+    assert len(index) == 1
+    assert 'box' not in index.query(5, 5) and 'box' not in index.query(14, 14)
+    assert 'box' in index.query(25, 5) and 'box' in index.query(39, 19)
+
+
+def test_zero_sized_box_is_listed_in_its_corner_cell():
+    index = BoxGridIndex(cellSize=10)
+    index.insert('line', 20, 5, 0, 30)
+    index.insert('point', 35, 35, 0, 0)
+
+    # One cell wide, down to the cell holding its last row
+    assert 'line' in index.query(20, 5) and 'line' in index.query(29, 39)
+    assert 'line' not in index.query(19, 5) and 'line' not in index.query(30, 5) and 'line' not in index.query(20, 40)
+    assert list(index.query(35, 35)) == ['point'] and list(index.query(45, 35)) == []
+
+
+def test_remove_of_an_unknown_box_is_a_no_op():
+    index = BoxGridIndex(cellSize=10)
+    index.insert('a', 0, 0, 10, 10)
+
+    index.remove('b')
+    index.remove('a')
+    index.remove('a')
+
+    assert len(index) == 0 and list(index.query(0, 0)) == []
+
+    index.insert('a', 0, 0, 10, 10)
+    index.clear()
+
+    assert len(index) == 0 and list(index.query(0, 0)) == []
@@ -0,0 +1,51 @@
+import json
+import os
+
+import pytest
+
+import dataset_export
+from dataset_export import export_dataset
+from utils import write_annotation_xml
+
+
+def write_annotations(ann_dir, filenames):
+    os.makedirs(ann_dir, exist_ok=True)
+
+    for idx, filename in enumerate(filenames):
+        write_annotation_xml(os.path.join(ann_dir, '{}.xml'.format(idx)), filename, 480, 640,
+                             [{'bbox': [10, 20, 110, 220], 'category_id': 'Buoy'}])
+
+
+def test_yolo_files_do_not_collide_on_image_names(tmp_path):
+    ann_dir, output_dir = str(tmp_path / 'annotation'), str(tmp_path / 'export')
+    write_annotations(ann_dir, ['a.jpg', 'a.png'])
+
+    assert export_dataset(ann_dir, str(tmp_path / 'image'), output_dir, formats=('coco', 'yolo'), workers=1) == 2
+
+    assert sorted(os.listdir(os.path.join(output_dir, 'yolo'))) == ['0.txt', '1.txt']
+    with open(os.path.join(output_dir, 'yolo', '0.txt')) as f:
+        assert f.read() == '3 0.093750 0.250000 0.156250 0.416667\n'
+
+    with open(os.path.join(output_dir, 'annotations.json')) as f:
+        coco = json.load(f)
+    assert [image['file_name'] for image in coco['images']] == ['a.jpg', 'a.png']
+    assert [annotation['bbox'] for annotation in coco['annotations']] == [[10, 20, 100, 200]] * 2
+    assert {annotation['category_id'] for annotation in coco['annotations']} == {4}
+
+
+def test_failed_export_leaves_no_coco_json(tmp_path, monkeypatch):
+    ann_dir, output_dir = str(tmp_path / 'annotation'), str(tmp_path / 'export')
+    write_annotations(ann_dir, ['a.jpg', 'b.jpg'])
+    export_annotation_file = dataset_export.export_annotation_file
+
+    def fail_on_second(ann_path, *args, **kwargs):
+        if ann_path.endswith('1.xml'):
+            raise OSError('unreadable')
+        return export_annotation_file(ann_path, *args, **kwargs)
+
+    monkeypatch.setattr(dataset_export, 'export_annotation_file', fail_on_second)
+
+    with pytest.raises(OSError):
+        export_dataset(ann_dir, str(tmp_path / 'image'), output_dir, formats=('coco',), workers=1)
+
+    assert os.listdir(output_dir) == []
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from utils import ANCHORS, BoundBox, bbox_iou, decode_netout, decode_netout_batch, get_bounding_boxes, sigmoid
+
+SHAPE_DIMS = (13, 13, 5, 6)
+
+
+def legacy_decode_netout(netout, shape_dims, anchors, nb_class, obj_threshold=0.3, nms_threshold=0.3):
+    # The per cell loop and per class pairwise suppression decode_netout replaced, kept as the reference
+    netout = np.reshape(np.array(netout), shape_dims)
+    grid_h, grid_w, nb_box = netout.shape[:3]
+
+    boxes = []
+
+    netout[..., 4] = sigmoid(netout[..., 4])
+    netout[..., 5] = netout[..., 4] * sigmoid(netout[..., 5])
+    netout[..., 5] *= netout[..., 5] > obj_threshold
+
+    for row in range(grid_h):
+        for col in range(grid_w):
+            for b in range(nb_box):
+
+                classes = netout[row, col, b, 5:]
+
+                if np.sum(classes) > 0:
+                    x, y, w, h, confidence = netout[row, col, b, :5]
+
+                    x = (col + sigmoid(x))
+                    y = (row + sigmoid(y))
+                    w = anchors[2 * b + 0] * np.exp(w)
+                    h = anchors[2 * b + 1] * np.exp(h)
+
+                    box = BoundBox(x - w / 2, y - h / 2, x + w / 2, y + h / 2, confidence, classes)
+
+                    boxes.append(box)
+
+    for c in range(nb_class):
+        sorted_indices = list(reversed(np.argsort([box.classes[c] for box in boxes])))
+
+        for i in range(len(sorted_indices)):
+            index_i = sorted_indices[i]
+
+            if boxes[index_i].classes[c] == 0:
+                continue
+            else:
+                for j in range(i + 1, len(sorted_indices)):
+                    index_j = sorted_indices[j]
+
+                    if bbox_iou(boxes[index_i], boxes[index_j]) >= nms_threshold:
+                        boxes[index_j].classes[c] = 0
+
+    boxes = [box for box in boxes if box.get_score() > 0]
+
+    return boxes
+
+
+def random_netout(seed, dtype=np.float32):
+    random = np.random.RandomState(seed)
+    netout = random.normal(0, 1, SHAPE_DIMS).astype(dtype)
+    # Dense enough objects that suppression has overlapping boxes to work on
+    netout[..., 4] = random.normal(0, 2, SHAPE_DIMS[:-1])
+
+    return netout
+
+
+def box_key(box):
+    return box.xmin, box.ymin, box.xmax, box.ymax
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_decode_netout_matches_legacy_loop(seed, dtype):
+    netout = random_netout(seed, dtype)
+
+    expected = sorted(legacy_decode_netout(netout, SHAPE_DIMS, ANCHORS, nb_class=1), key=box_key)
+    decoded = sorted(decode_netout(netout.copy(), SHAPE_DIMS, ANCHORS, nb_class=1), key=box_key)
+
+    assert len(expected) > 0
+    assert len(decoded) == len(expected)
+    # The loop's float32 scalars are promoted to float64 by NumPy 1.x but not by 2.x, hence the tolerance here.
+    # Pixel boxes are compared exactly below.
+    np.testing.assert_allclose([box_key(box) for box in decoded], [box_key(box) for box in expected], atol=1e-5)
+    np.testing.assert_allclose([box.get_score() for box in decoded], [box.get_score() for box in expected], rtol=1e-6)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_pixel_boxes_match_legacy_loop(seed):
+    netout = random_netout(seed)
+    image = np.zeros((1080, 1920, 3), dtype=np.uint8)
+
+    expected = get_bounding_boxes(image, legacy_decode_netout(netout, SHAPE_DIMS, ANCHORS, nb_class=1), 13, 13)
+    boxes, _, _ = decode_netout_batch(netout[np.newaxis], SHAPE_DIMS, ANCHORS, nb_class=1)[0]
+
+    assert sorted(get_bounding_boxes(image, boxes, 13, 13)) == sorted(expected)
+
+
+def test_decode_netout_batch_matches_single_images():
+    netouts = np.stack([random_netout(seed) for seed in range(4)])
+
+    for netout, (boxes, scores, _) in zip(netouts, decode_netout_batch(netouts, SHAPE_DIMS, ANCHORS, nb_class=1)):
+        single = decode_netout(netout, SHAPE_DIMS, ANCHORS, nb_class=1)
+
+        np.testing.assert_array_equal(boxes, [box_key(box) for box in single])
+        np.testing.assert_array_equal(scores, [box.get_score() for box in single])
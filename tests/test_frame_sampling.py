@@ -0,0 +1,105 @@
+import os
+
+import numpy as np
+import pytest
+
+from frame_sampling import extract_frames, sample_frame_indices
+
+
+@pytest.mark.parametrize('strategy', ['random', 'uniform'])
+@pytest.mark.parametrize('ratio', [0, 0.1, 1, 1.5])
+def test_sample_frame_indices_are_unique_and_in_range(strategy, ratio):
+    indices = sample_frame_indices(100, ratio, strategy, seed=0)
+
+    assert len(indices) == int(min(ratio, 1) * 100)
+    assert len(set(indices)) == len(indices)
+    assert all(0 <= index < 100 for index in indices)
+    assert indices == sorted(indices)
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        sample_frame_indices(100, 0.1, 'every')
+
+
+def write_numbered_video(video_path, frame_count):
+    # Every frame is filled with its own index as gray level
+    cv2 = pytest.importorskip('cv2')
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'MJPG'), 25, (64, 48))
+
+    for idx in range(frame_count):
+        writer.write(np.full((48, 64, 3), idx, dtype=np.uint8))
+    writer.release()
+
+
+@pytest.mark.parametrize('seek_threshold', [None, 0, 5])
+def test_extracted_frames_are_the_sampled_ones(tmp_path, seek_threshold):
+    from PIL import Image
+
+    video_path = str(tmp_path / 'video.avi')
+    write_numbered_video(video_path, 120)
+
+    frame_paths = list(extract_frames(video_path, str(tmp_path), ratio=0.1, strategy='uniform',
+                                      seek_threshold=seek_threshold))
+
+    assert [os.path.basename(path) for path in frame_paths] == \
+        ['video_{}.jpg'.format(index) for index in sample_frame_indices(120, 0.1, 'uniform')]
+
+    for path in frame_paths:
+        index = int(os.path.basename(path).split('_')[1].split('.')[0])
+        assert abs(float(np.mean(np.asarray(Image.open(path)))) - index) < 3
+
+
+def test_existing_frames_are_skipped(tmp_path):
+    video_path = str(tmp_path / 'video.avi')
+    write_numbered_video(video_path, 60)
+
+    first = list(extract_frames(video_path, str(tmp_path), ratio=0.1, strategy='uniform'))
+    mtimes = [os.path.getmtime(path) for path in first]
+    second = list(extract_frames(video_path, str(tmp_path), ratio=0.1, strategy='uniform', skip_existing=True))
+
+    assert second == first
+    assert [os.path.getmtime(path) for path in second] == mtimes
+
+
+def test_inaccurate_seek_falls_back_to_grabbing(tmp_path, monkeypatch):
+    cv2 = pytest.importorskip('cv2')
+    from PIL import Image
+
+    video_path = str(tmp_path / 'video.avi')
+    write_numbered_video(video_path, 120)
+
+    VideoCapture = cv2.VideoCapture
+
+    class LandingShortCapture:
+        # Seeks land 7 frames before the asked one, like a seek to the previous keyframe
+        def __init__(self, path):
+            self.capture = VideoCapture(path)
+
+        def set(self, prop, value):
+            return self.capture.set(prop, max(0, value - 7))
+
+        def __getattr__(self, name):
+            return getattr(self.capture, name)
+
+    monkeypatch.setattr(cv2, 'VideoCapture', LandingShortCapture)
+
+    for path in extract_frames(video_path, str(tmp_path), ratio=0.1, strategy='uniform', seek_threshold=0):
+        index = int(os.path.basename(path).split('_')[1].split('.')[0])
+        assert abs(float(np.mean(np.asarray(Image.open(path)))) - index) < 3
+
+
+def test_should_stop_interrupts_the_grab_loop(tmp_path):
+    video_path = str(tmp_path / 'video.avi')
+    write_numbered_video(video_path, 120)
+    polls = []
+
+    def should_stop():
+        polls.append(1)
+        return len(polls) > 10
+
+    frame_paths = list(extract_frames(video_path, str(tmp_path), ratio=0.05, strategy='uniform', seek_threshold=None,
+                                      should_stop=should_stop))
+
+    # The first frame is 0, the next one is 20 frames later, its grab loop stops on the 11th poll
+    assert [os.path.basename(path) for path in frame_paths] == ['video_0.jpg']
@@ -0,0 +1,72 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from inference_backend import OnnxBackend, compare_backends
+
+
+class FakeSession:
+    def __init__(self, path, options, providers=None):
+        self.options = options
+
+    def get_inputs(self):
+        return [types.SimpleNamespace(name='input_image', shape=[None, 416, 416, 3])]
+
+
+@pytest.fixture
+def fake_onnxruntime(monkeypatch):
+    ort = types.ModuleType('onnxruntime')
+    ort.SessionOptions = types.SimpleNamespace
+    ort.GraphOptimizationLevel = types.SimpleNamespace(ORT_ENABLE_ALL='ORT_ENABLE_ALL')
+    ort.ExecutionMode = types.SimpleNamespace(ORT_SEQUENTIAL='ORT_SEQUENTIAL', ORT_PARALLEL='ORT_PARALLEL')
+    ort.InferenceSession = FakeSession
+    monkeypatch.setitem(sys.modules, 'onnxruntime', ort)
+
+
+def session_options(backend):
+    backend.load()
+    return backend._OnnxBackend__session.options
+
+
+@pytest.mark.parametrize('inter_op_threads', [None, 1])
+def test_onnx_runs_sequentially_without_inter_op_parallelism(fake_onnxruntime, inter_op_threads):
+    options = session_options(OnnxBackend('model.onnx', intra_op_threads=4, inter_op_threads=inter_op_threads))
+
+    assert options.intra_op_num_threads == 4
+    assert getattr(options, 'execution_mode', 'ORT_SEQUENTIAL') == 'ORT_SEQUENTIAL'
+
+
+def test_onnx_runs_in_parallel_with_inter_op_threads(fake_onnxruntime):
+    options = session_options(OnnxBackend('model.onnx', inter_op_threads=2))
+
+    assert options.inter_op_num_threads == 2
+    assert options.execution_mode == 'ORT_PARALLEL'
+
+
+def test_keras_and_onnx_boxes_match(tmp_path):
+    tf = pytest.importorskip('tensorflow')
+    pytest.importorskip('tf2onnx')
+    pytest.importorskip('onnxruntime')
+
+    # A tiny stand-in for the detector with its input and output shapes, the first anchor of every cell is confident
+    inputs = tf.keras.Input((416, 416, 3))
+    features = tf.keras.layers.Conv2D(30, 32, strides=32, padding='same')(inputs)
+    model = tf.keras.Model(inputs, tf.keras.layers.Reshape((13, 13, 5, 6))(features))
+    kernel, bias = model.layers[1].get_weights()
+    bias[4::6] = -10
+    bias[4] = 10
+    model.layers[1].set_weights([np.random.RandomState(0).normal(0, 0.01, kernel.shape), bias])
+
+    model_path = str(tmp_path / 'model.h5')
+    model.save(model_path)
+
+    image_paths = []
+    for i in range(3):
+        image_paths.append(str(tmp_path / 'image_{}.jpg'.format(i)))
+        image = np.random.RandomState(i).randint(0, 256, (240, 320, 3), dtype=np.uint8)
+        Image.fromarray(image).save(image_paths[-1])
+
+    assert compare_backends(model_path, image_paths, batch_size=2) == []
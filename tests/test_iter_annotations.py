@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from utils import iter_annotations, parse_annotation, parse_filtered_annotation_file
+
+LABELS = ['Ship', 'Buoy']
+
+ANNOTATIONS = {
+    'a.xml': '''<annotation>
+    <filename>a.jpg</filename>
+    <size><width>640</width><height>480</height></size>
+    <object><name>Other</name><bndbox><xmin>1</xmin><ymin>2</ymin><xmax>30</xmax><ymax>40</ymax></bndbox></object>
+    <!-- a comment -->
+    <object><name>Ship</name><bndbox><xmin>10.4</xmin><ymin>20</ymin><xmax>110.6</xmax><ymax>220</ymax></bndbox></object>
+    <object><name>Buoy</name><bndbox><xmin>5</xmin><ymin>5</ymin><xmax>8</xmax><ymax>50</ymax></bndbox></object>
+</annotation>''',
+    'b.xml': '''<annotation>
+    <filename>b.jpg</filename>
+    <object>
+        <name>Buoy</name>
+        <bndbox><xmin>5</xmin><ymin>6</ymin></bndbox>
+        <part><name>Ship</name><bndbox><xmin>7</xmin><ymin>8</ymin><xmax>90</xmax><ymax>100</ymax></bndbox></part>
+        <part><name>Other</name></part>
+    </object>
+    <object><name>Ship</name><bndbox><xmin>0</xmin><ymin>0</ymin><xmax>4</xmax><ymax>4</ymax></bndbox></object>
+</annotation>''',
+    'c.xml': '''<annotation>
+    <filename>c.jpg</filename>
+    <size><width>320</width><height>240</height></size>
+    <object><name>Other</name><bndbox><xmin>1</xmin><ymin>2</ymin><xmax>30</xmax><ymax>40</ymax></bndbox></object>
+</annotation>''',
+    'd.xml': '''<annotation>
+    <filename>d.jpg</filename>
+    <size><width>320</width><height>240</height></size>
+</annotation>''',
+}
+
+
+@pytest.fixture
+def ann_dir(tmp_path):
+    ann_dir = str(tmp_path / 'annotation')
+    os.makedirs(ann_dir)
+
+    for name, xml in ANNOTATIONS.items():
+        with open(os.path.join(ann_dir, name), 'w') as f:
+            f.write(xml)
+
+    return ann_dir
+
+
+def object_names(records):
+    return {os.path.basename(img["filename"]): [obj["name"] for obj in img["object"]] for img in records}
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_records_match_parse_annotation(ann_dir, workers):
+    all_imgs, _ = parse_annotation(ann_dir, 'image', LABELS, 'test')
+
+    assert list(iter_annotations(ann_dir, 'image', LABELS, workers=workers, max_in_flight=1)) == all_imgs
+
+
+def test_nested_parts_keep_document_order(ann_dir):
+    records = list(iter_annotations(ann_dir, 'image', LABELS))
+
+    # The Other part is dropped, the box of the Buoy is kept incomplete, c.xml and d.xml have no object left
+    assert object_names(records) == {'a.jpg': ['Ship', 'Buoy'], 'b.jpg': ['Buoy', 'Ship', 'Ship']}
+    assert records[1]["object"][0] == {'name': 'Buoy', 'xmin': 5, 'ymin': 6}
+    assert records[0]["object"][0] == {'name': 'Ship', 'xmin': 10, 'ymin': 20, 'xmax': 111, 'ymax': 220}
+
+
+def test_min_size_drops_small_and_incomplete_boxes(ann_dir):
+    # The 3 pixels wide Buoy of a.xml, the 4 pixels Ship and the Buoy without xmax and ymax of b.xml
+    records = list(iter_annotations(ann_dir, 'image', LABELS, min_size=5))
+
+    assert object_names(records) == {'a.jpg': ['Ship'], 'b.jpg': ['Ship']}
+    assert records[1]["object"] == [{'name': 'Ship', 'xmin': 7, 'ymin': 8, 'xmax': 90, 'ymax': 100}]
+
+    # Boxes exactly min_size pixels wide are kept
+    records = list(iter_annotations(ann_dir, 'image', LABELS, min_size=4))
+
+    assert object_names(records) == {'a.jpg': ['Ship'], 'b.jpg': ['Ship', 'Ship']}
+
+
+def test_images_without_objects_left_are_none(ann_dir):
+    assert parse_filtered_annotation_file(os.path.join(ann_dir, 'c.xml'), 'image', {'Ship'}) is None
+    assert parse_filtered_annotation_file(os.path.join(ann_dir, 'd.xml'), 'image', {'Ship'}) is None
+    assert parse_filtered_annotation_file(os.path.join(ann_dir, 'a.xml'), 'image', {'Ship'}, min_size=500) is None
+
+    assert parse_filtered_annotation_file(os.path.join(ann_dir, 'c.xml'), 'image', {'Other'}) == {
+        'object': [{'name': 'Other', 'xmin': 1, 'ymin': 2, 'xmax': 30, 'ymax': 40}],
+        'filename': os.path.join('image', 'c.jpg'), 'width': 320, 'height': 240}
+
+
+def test_labels_are_required(ann_dir):
+    with pytest.raises(ValueError):
+        list(iter_annotations(ann_dir, 'image', []))
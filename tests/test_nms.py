@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from nms import iou_matrix, non_max_suppression
+from utils import BoundBox, _suppress, bbox_iou
+
+
+def legacy_suppress(boxes, classes, nms_threshold):
+    # The per class pairwise loop _suppress replaced, on BoundBox objects like decode_netout had them
+    boxes = [BoundBox(*box, classes=np.array(box_classes)) for box, box_classes in zip(boxes, classes)]
+
+    for c in range(classes.shape[1]):
+        sorted_indices = list(reversed(np.argsort([box.classes[c] for box in boxes])))
+
+        for i in range(len(sorted_indices)):
+            index_i = sorted_indices[i]
+
+            if boxes[index_i].classes[c] == 0:
+                continue
+            else:
+                for j in range(i + 1, len(sorted_indices)):
+                    index_j = sorted_indices[j]
+
+                    if bbox_iou(boxes[index_i], boxes[index_j]) >= nms_threshold:
+                        boxes[index_j].classes[c] = 0
+
+    return [(box.xmin, box.ymin, box.xmax, box.ymax) for box in boxes if np.any(box.classes > 0)], \
+        [box.classes for box in boxes if np.any(box.classes > 0)]
+
+
+def random_boxes(random, count, nb_class):
+    xy = random.rand(count, 2) * 10
+    wh = 0.5 + random.rand(count, 2) * 3
+    classes = random.rand(count, nb_class) * (random.rand(count, nb_class) > 0.4)
+
+    return np.concatenate([xy, xy + wh], axis=-1), classes
+
+
+def test_iou_matrix_matches_bbox_iou():
+    boxes, _ = random_boxes(np.random.RandomState(0), 20, 1)
+    expected = [[bbox_iou(BoundBox(*a), BoundBox(*b)) for b in boxes] for a in boxes]
+
+    np.testing.assert_allclose(iou_matrix(boxes, boxes), expected)
+
+
+def test_overlapping_boxes_suppressed_within_a_class():
+    boxes = [[0, 0, 10, 10], [1, 1, 11, 11], [20, 20, 30, 30]]
+
+    assert non_max_suppression(boxes, [0.9, 0.8, 0.7], iou_threshold=0.3).tolist() == [0, 2]
+
+
+def test_overlapping_boxes_of_different_classes_both_survive():
+    boxes = [[0, 0, 10, 10], [0, 0, 10, 10], [1, 1, 11, 11]]
+    kept = non_max_suppression(boxes, [0.9, 0.8, 0.7], iou_threshold=0.3, class_ids=[0, 1, 0])
+
+    assert kept.tolist() == [0, 1]
+
+
+def test_class_offset_with_negative_coordinates():
+    # Boxes partly left of the origin must not be shifted onto the boxes of the next class
+    boxes = [[-5, -5, 5, 5], [-4, -4, 6, 6], [15, 15, 25, 25]]
+    kept = non_max_suppression(boxes, [0.9, 0.8, 0.7], iou_threshold=0.3, class_ids=[0, 1, 1])
+
+    assert sorted(kept.tolist()) == [0, 1, 2]
+
+
+@pytest.mark.parametrize('max_detections', [1, 2, 5])
+def test_max_detections_keeps_the_best_boxes(max_detections):
+    boxes, _ = random_boxes(np.random.RandomState(1), 50, 1)
+    scores = np.random.RandomState(2).rand(50)
+
+    unlimited = non_max_suppression(boxes, scores, iou_threshold=0.3)
+    limited = non_max_suppression(boxes, scores, iou_threshold=0.3, max_detections=max_detections)
+
+    assert limited.tolist() == unlimited[:max_detections].tolist()
+
+
+def test_empty_input():
+    assert non_max_suppression(np.zeros((0, 4)), np.zeros(0)).tolist() == []
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('nb_class', [1, 3])
+def test_suppress_matches_legacy_loop(seed, nb_class):
+    random = np.random.RandomState(seed)
+    boxes, classes = random_boxes(random, 60, nb_class)
+    boxes, classes = boxes[np.any(classes > 0, axis=-1)], classes[np.any(classes > 0, axis=-1)]
+    confidences = classes.max(axis=-1)
+
+    expected_boxes, expected_classes = legacy_suppress(boxes, classes.copy(), 0.3)
+    kept_boxes, _, kept_classes = _suppress(boxes, confidences, classes, 0.3, None)
+
+    np.testing.assert_array_equal(kept_boxes, expected_boxes)
+    np.testing.assert_array_equal(kept_classes, expected_classes)
@@ -0,0 +1,65 @@
+import numpy as np
+from PIL import Image
+
+from utils import predict_paths
+
+
+class MemoryCache:
+    def __init__(self):
+        self.entries = {}
+
+    def key(self, image_path, config):
+        return image_path
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, boxes, image_size):
+        self.entries[key] = (boxes, image_size)
+
+
+class ZeroModel:
+    def predict(self, input_images):
+        netouts = np.full((len(input_images), 13, 13, 5, 6), -10, dtype=np.float32)
+        netouts[:, 6, 6, 0] = [0, 0, 0, 0, 10, 10]
+        return netouts
+
+
+def write_image(tmp_path, name):
+    path = str(tmp_path / name)
+    Image.fromarray(np.zeros((120, 160, 3), dtype=np.uint8)).save(path)
+    return path
+
+
+def test_cache_hits_do_not_load_the_model(tmp_path):
+    cache = MemoryCache()
+    image_path = write_image(tmp_path, 'a.jpg')
+    cache.put(image_path, [[1, 2, 3, 4]], (120, 160))
+
+    def load_model():
+        raise AssertionError('the model is loaded although every path is cached')
+
+    assert predict_paths([image_path], load_model, cache=cache) == [([[1, 2, 3, 4]], (120, 160))]
+
+
+def test_cache_misses_load_the_model_once(tmp_path):
+    cache = MemoryCache()
+    image_paths = [write_image(tmp_path, '{}.jpg'.format(idx)) for idx in range(3)]
+    loads = []
+
+    def load_model():
+        loads.append(1)
+        return ZeroModel()
+
+    results = predict_paths(image_paths, load_model, batch_size=2, cache=cache)
+
+    assert len(loads) == 1
+    assert [image_size for _, image_size in results] == [(120, 160)] * 3
+    assert all(len(boxes) == 1 for boxes, _ in results)
+    assert set(cache.entries) == set(image_paths)
+
+
+def test_model_object_is_used_directly(tmp_path):
+    image_path = write_image(tmp_path, 'a.jpg')
+
+    assert predict_paths([image_path], ZeroModel())[0] == predict_paths([image_path], lambda: ZeroModel())[0]
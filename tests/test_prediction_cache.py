@@ -0,0 +1,20 @@
+from prediction_cache import PredictionCache
+
+
+def test_backends_do_not_share_entries(tmp_path):
+    model_path = str(tmp_path / 'model.h5')
+    image_path = str(tmp_path / 'image.jpg')
+
+    for path in (model_path, image_path):
+        with open(path, 'wb') as f:
+            f.write(b'content')
+
+    cache_dir = str(tmp_path / 'cache')
+    keras_cache = PredictionCache(cache_dir, model_path, backend='keras')
+    onnx_cache = PredictionCache(cache_dir, model_path, backend='onnx')
+
+    keras_cache.put(keras_cache.key(image_path, {}), [[1, 2, 3, 4]], (10, 10))
+
+    assert onnx_cache.key(image_path, {}) != keras_cache.key(image_path, {})
+    assert onnx_cache.get(onnx_cache.key(image_path, {})) is None
+    assert keras_cache.get(keras_cache.key(image_path, {})) == ([[1, 2, 3, 4]], (10, 10))
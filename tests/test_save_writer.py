@@ -0,0 +1,182 @@
+import os
+import sqlite3
+import threading
+
+from annotation_store import AnnotationStore
+from save_writer import SaveWriter
+
+
+class FlakyStore:
+    # Commits like AnnotationStore, the first failures commits raise
+    def __init__(self, failures=0, batch_size=None):
+        self.failures = failures
+        self.batch_size = batch_size
+        self.pending = []
+        self.committed = []
+        self.flushes = 0
+        self.closed = False
+
+    def put(self, session, xml_name, **annotation):
+        self.pending.append(xml_name)
+
+        if len(self.pending) == self.batch_size:
+            self.flush()
+            return True
+
+        return False
+
+    def flush(self):
+        self.flushes += 1
+
+        if self.failures > 0:
+            self.failures -= 1
+            raise sqlite3.OperationalError('disk I/O error')
+
+        self.committed += self.pending
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.closed = True
+
+
+def annotation(filename):
+    return {'filename': filename, 'height': 480, 'width': 640,
+            'instances': [{'bbox': [1, 2, 3, 4], 'category_id': 'Ship'}]}
+
+
+def make_image(tmp_path, name):
+    (tmp_path / 'image').mkdir(exist_ok=True)
+    path = tmp_path / name
+    path.write_bytes(b'jpeg')
+    return str(path), str(tmp_path / 'image' / name)
+
+
+def test_xml_is_written_before_the_image_is_moved(tmp_path):
+    saved, errors = [], []
+    writer = SaveWriter(onSaved=saved.append, onError=errors.append)
+    image_path, destination = make_image(tmp_path, 'a.jpg')
+
+    writer.submit(str(tmp_path / 'a.xml'), annotation('a.jpg'), image_path, destination)
+    writer.close()
+
+    assert saved == ['a.xml'] and errors == []
+    assert os.path.exists(str(tmp_path / 'a.xml'))
+    assert os.path.exists(destination) and not os.path.exists(image_path)
+
+
+def test_images_are_moved_only_after_their_commit(tmp_path):
+    saved, errors = [], []
+    store = FlakyStore(failures=1)
+    writer = SaveWriter(onSaved=saved.append, onError=errors.append, store=store)
+    first = make_image(tmp_path, 'a.jpg')
+    second = make_image(tmp_path, 'b.jpg')
+
+    writer.submit(str(tmp_path / 'a.xml'), annotation('a.jpg'), *first)
+    writer.flush()
+
+    # The failed commit reports its annotation and leaves the image for labeling
+    assert saved == [] and len(errors) == 1 and errors[0].startswith('a.xml: ')
+    assert os.path.exists(first[0])
+
+    writer.submit(str(tmp_path / 'b.xml'), annotation('b.jpg'), *second)
+    writer.close()
+
+    assert saved == ['a.xml', 'b.xml'] and len(errors) == 1
+    assert store.committed == ['a.xml', 'b.xml'] and store.closed
+    assert os.path.exists(first[1]) and os.path.exists(second[1])
+
+
+def test_every_annotation_of_a_failed_commit_is_reported(tmp_path):
+    saved, errors = [], []
+    writer = SaveWriter(onSaved=saved.append, onError=errors.append, store=FlakyStore(failures=10))
+
+    for name in ('a', 'b'):
+        writer.submit(str(tmp_path / (name + '.xml')), annotation(name + '.jpg'), *make_image(tmp_path, name + '.jpg'))
+        writer.flush()
+
+    writer.close()
+
+    assert saved == []
+    assert {error.split(':')[0] for error in errors} == {'a.xml', 'b.xml'}
+    assert os.path.exists(str(tmp_path / 'a.jpg')) and os.path.exists(str(tmp_path / 'b.jpg'))
+
+
+class GatedStore(FlakyStore):
+    # Holds the writer thread in its first put until opened, so that the next saves queue up meanwhile
+    def __init__(self, destinations, **kwargs):
+        super().__init__(**kwargs)
+        self.destinations = destinations
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+        self.moved_before_commit = []
+
+    def put(self, session, xml_name, **annotation):
+        self.entered.set()
+        self.gate.wait()
+        # Destinations are <name>.jpg for the <name>.xml annotations
+        self.moved_before_commit += [path for path in self.destinations if os.path.exists(path) and
+                                     os.path.basename(path).replace('.jpg', '.xml') not in self.committed]
+        return super().put(session, xml_name, **annotation)
+
+
+def queue_saves(tmp_path, store_class, names, **kwargs):
+    images = {name: make_image(tmp_path, name + '.jpg') for name in names}
+    store = store_class([destination for _, destination in images.values()], **kwargs)
+    saved, errors = [], []
+    writer = SaveWriter(onSaved=saved.append, onError=errors.append, store=store)
+
+    for name in names:
+        writer.submit(str(tmp_path / (name + '.xml')), annotation(name + '.jpg'), *images[name])
+        # The first save is taken by the writer thread before the others are queued
+        store.entered.wait()
+
+    store.gate.set()
+    writer.flush()
+
+    return writer, store, images, saved, errors
+
+
+def test_buffered_saves_are_not_moved_before_their_commit(tmp_path):
+    writer, store, images, saved, errors = queue_saves(tmp_path, GatedStore, ['a', 'b', 'c', 'd'])
+
+    # a alone, then b, c and d together once the queue ran empty, nothing moved while only buffered
+    assert store.committed == ['a.xml', 'b.xml', 'c.xml', 'd.xml'] and store.flushes == 2
+    assert store.moved_before_commit == []
+    assert saved == ['a.xml', 'b.xml', 'c.xml', 'd.xml'] and errors == []
+    assert all(os.path.exists(destination) for _, destination in images.values())
+
+    writer.close()
+
+
+def test_full_batches_are_moved_as_they_commit(tmp_path):
+    writer, store, images, saved, errors = queue_saves(tmp_path, GatedStore, ['a', 'b', 'c', 'd', 'e'],
+                                                       batch_size=2)
+
+    # a alone, then the full b, c and d, e batches
+    assert store.committed == ['a.xml', 'b.xml', 'c.xml', 'd.xml', 'e.xml'] and store.flushes == 3
+    assert store.moved_before_commit == []
+    assert saved == ['a.xml', 'b.xml', 'c.xml', 'd.xml', 'e.xml'] and errors == []
+
+    writer.close()
+
+
+def test_partial_batch_is_committed_before_the_writer_goes_idle(tmp_path):
+    db_path = str(tmp_path / 'annotations.db')
+    store = AnnotationStore(db_path, batch_size=64)
+    saved = []
+    writer = SaveWriter(onSaved=saved.append, store=store)
+
+    for name in ('a', 'b', 'c'):
+        writer.submit(str(tmp_path / (name + '.xml')), annotation(name + '.jpg'), *make_image(tmp_path, name + '.jpg'))
+    writer.flush()
+
+    # Visible to another connection without a close
+    connection = sqlite3.connect(db_path)
+    committed = [name for name, in connection.execute('SELECT xml_name FROM images ORDER BY id')]
+    connection.close()
+
+    assert committed == ['a.xml', 'b.xml', 'c.xml']
+    assert saved == ['a.xml', 'b.xml', 'c.xml'] and store.pending_count == 0
+
+    writer.close()
@@ -0,0 +1,99 @@
+import json
+import time
+import timeit
+import types
+
+import stage_timer
+from stage_timer import StageTimer, percentile
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+
+    assert percentile(values, 50) == 50 and percentile(values, 95) == 95 and percentile(values, 100) == 100
+    assert percentile(values, 0) == 1
+    assert percentile([1, 2, 3, 4], 50) == 2 and percentile([1, 2, 3, 4], 95) == 4
+    assert percentile(list(range(1, 21)), 95) == 19
+    assert percentile([7], 50) == 7 and percentile([7], 95) == 7
+
+
+def test_stats_cover_the_last_window_samples():
+    timer = StageTimer(window=20)
+    timer.enable()
+
+    for seconds in range(100):
+        timer.record('predict', seconds)
+    timer.record('decode', 0.5)
+
+    # Only 80 to 99 are left
+    assert timer.stats() == {'predict': (20, 89, 98), 'decode': (1, 0.5, 0.5)}
+
+    timer.reset()
+
+    assert timer.stats() == {}
+
+
+def test_stage_records_its_wall_time(monkeypatch):
+    clock = iter([10.0, 10.25])
+    monkeypatch.setattr(stage_timer, 'time', types.SimpleNamespace(perf_counter=lambda: next(clock), time=time.time))
+    timer = StageTimer()
+    timer.enable()
+
+    with timer.stage('save annotation'):
+        pass
+
+    assert timer.stats() == {'save annotation': (1, 0.25, 0.25)}
+
+
+def test_disabled_timer_records_nothing():
+    timer = StageTimer()
+
+    assert timer.stage('predict') is timer.stage('decode') is stage_timer._NULL_TIMING
+
+    with timer.stage('predict'):
+        pass
+    timer.record('predict', 1.0)
+
+    assert timer.stats() == {}
+
+    # Samples taken while enabled outlive a disable
+    timer.enable()
+    timer.record('predict', 1.0)
+    timer.disable()
+    timer.record('predict', 2.0)
+
+    assert timer.stats() == {'predict': (1, 1.0, 1.0)}
+
+
+def test_disabled_timer_overhead_is_negligible():
+    timer = StageTimer()
+
+    def timed():
+        with timer.stage('predict'):
+            pass
+
+    # A few hundred nanoseconds per stage on any machine, 5 microseconds leaves room for a slow CI runner
+    assert min(timeit.repeat(timed, number=100000, repeat=5)) / 100000 < 5e-6
+
+
+def test_log_is_json_lines(tmp_path):
+    log_path = str(tmp_path / 'stages.jsonl')
+    timer = StageTimer()
+
+    timer.enable(log_path)
+    timer.record('predict', 0.5)
+    timer.record('decode', 0.25)
+    timer.disable()
+    timer.record('decode', 1.0)
+
+    # Appended to when enabled again
+    timer.enable(log_path)
+    timer.record('save annotation', 0.125)
+    timer.disable()
+
+    with open(log_path) as f:
+        lines = [json.loads(line) for line in f]
+
+    assert [(line['stage'], line['seconds']) for line in lines] == [('predict', 0.5), ('decode', 0.25),
+                                                                    ('save annotation', 0.125)]
+    assert all(isinstance(line['time'], float) for line in lines)
@@ -1,19 +1,29 @@
-from lxml import objectify
-
-import cv2
 from tqdm import tqdm
 import numpy as np
-import xml.etree.ElementTree as ET
 import os
+import errno
+import shutil
+import inspect
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import count
 from glob import glob
 from PIL import Image
+from nms import non_max_suppression
+from stage_timer import timer
 
 
 class ImageContainer:
-    def __init__(self, image, filePath):
+    def __init__(self, image, filePath, imageSize=None):
+        # imageSize is the (width, height) of the original file when image is a scaled down copy of it
         self.__image = image
-        self.__imageWidth = image.width() if image is not None else 0
-        self.__imageHeight = image.height() if image is not None else 0
+
+        if imageSize is not None:
+            self.__imageWidth, self.__imageHeight = imageSize
+        else:
+            self.__imageWidth = image.width() if image is not None else 0
+            self.__imageHeight = image.height() if image is not None else 0
         self.__filePath = filePath
 
     @property
@@ -39,6 +49,8 @@ class ImageContainer:
 
 
 def xml_root(filename, height, width):
+    from lxml import objectify
+
     E = objectify.ElementMaker(annotate=False)
     return E.annotation(
         E.filename(filename),
@@ -51,6 +63,8 @@ def xml_root(filename, height, width):
 
 
 def instance_to_xml(annotation):
+    from lxml import objectify
+
     E = objectify.ElementMaker(annotate=False)
     x_min, y_min, x_max, y_max = annotation["bbox"]
     return E.object(
@@ -64,6 +78,35 @@ def instance_to_xml(annotation):
             )
 
 
+def write_annotation_xml(file_path, filename, height, width, instances):
+    # Written to a temporary file and renamed, so that an interrupted save never leaves a truncated xml behind
+    from lxml import etree
+
+    annotation = xml_root(filename, height, width)
+
+    for instance in instances:
+        annotation.append(instance_to_xml(instance))
+
+    tmp_path = file_path + '.tmp'
+    etree.ElementTree(annotation).write(tmp_path)
+    os.replace(tmp_path, file_path)
+
+
+def move_file(src, dst):
+    # A rename when both paths are on one filesystem, otherwise a copy to a temporary file next to dst that is
+    # renamed into place before src is removed
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+        tmp_path = dst + '.tmp'
+        shutil.copy2(src, tmp_path)
+        os.replace(tmp_path, dst)
+        os.remove(src)
+
+
 def globWithTypes(path, exts):
     path = os.path.join(path, "*")
     filePath = []
@@ -80,6 +123,9 @@ def globWithTypes(path, exts):
 ################################################
 
 
+ANCHORS = [0.78353, 1.57529, 1.02559, 0.65428, 1.97076, 1.00357, 3.76925, 2.32570, 0.35109, 0.39320]
+
+
 class BoundBox:
     def __init__(self, xmin, ymin, xmax, ymax, confidence=None, classes=None):
         self.xmin = xmin
@@ -116,96 +162,221 @@ def prediction(image,
                grid_w=13,
                box_num=5,
                normalize=True,
-               anchors=None
+               anchors=None,
+               max_detections=None
                ):
 
+    return predict_batch([image],
+                         model,
+                         batch_size=1,
+                         obj_threshold=obj_threshold,
+                         nms_threshold=nms_threshold,
+                         image_width=image_width,
+                         image_height=image_height,
+                         grid_h=grid_h,
+                         grid_w=grid_w,
+                         box_num=box_num,
+                         normalize=normalize,
+                         anchors=anchors,
+                         max_detections=max_detections
+                         )[0]
+
+
+def predict_batch(images,
+                  model,
+                  batch_size=8,
+                  obj_threshold=0.3,
+                  nms_threshold=0.3,
+                  image_width=416,
+                  image_height=416,
+                  grid_h=13,
+                  grid_w=13,
+                  box_num=5,
+                  normalize=True,
+                  anchors=None,
+                  max_detections=None
+                  ):
+
     if anchors is None:
-        anchors = [0.78353, 1.57529, 1.02559, 0.65428, 1.97076, 1.00357, 3.76925, 2.32570, 0.35109, 0.39320]
+        anchors = ANCHORS
 
-    input_image = cv2.resize(image, (image_height, image_width))
-    input_image = input_image / 255. if normalize else input_image
-    input_image = np.expand_dims(input_image, 0)
+    bounding_boxes = []
+
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size]
+
+        with timer.stage('preprocess'):
+            input_images = np.stack([preprocess_image(image, image_width, image_height, normalize) for image in batch])
+
+        with timer.stage('model.predict'):
+            netouts = model.predict(input_images)
+
+        with timer.stage('decode_netout'):
+            decoded = decode_netout_batch(netouts,
+                                          shape_dims=(grid_h, grid_w, box_num, 4 + 1 + 1),
+                                          anchors=anchors,
+                                          nb_class=1,
+                                          obj_threshold=obj_threshold,
+                                          nms_threshold=nms_threshold,
+                                          max_detections=max_detections
+                                          )
+
+        for image, (boxes, _, _) in zip(batch, decoded):
+            bounding_boxes.append(get_bounding_boxes(image, boxes, grid_h, grid_w))
+
+    return bounding_boxes
+
+
+def predict_paths(image_paths, model, batch_size=8, cache=None, **kwargs):
+    # Returns (boxes, (height, width)) per image path. Proposals found in the cache skip the model entirely.
+    # model is anything with predict, or a callable returning it (e.g. lambda: loader.model) that is only called
+    # once a path misses the cache, so that cached proposals do not wait for the model to be loaded.
+    config = prediction_config(**kwargs)
+    results = [None] * len(image_paths)
+    keys = [None] * len(image_paths)
+    misses = []
+
+    for idx, image_path in enumerate(image_paths):
+        if cache is not None:
+            keys[idx] = cache.key(image_path, config)
+            results[idx] = cache.get(keys[idx])
+
+        if results[idx] is None:
+            misses.append(idx)
+
+    if len(misses) > 0 and not hasattr(model, 'predict'):
+        model = model()
+
+    for start in range(0, len(misses), batch_size):
+        batch = misses[start:start + batch_size]
 
-    netout = model.predict(input_image)
+        with timer.stage('image load'):
+            images = [load_image(image_paths[idx]) for idx in batch]
 
-    boxes = decode_netout(netout[0],
-                          shape_dims=(grid_h, grid_w, box_num, 4 + 1 + 1),
-                          anchors=anchors,
-                          nb_class=1,
-                          obj_threshold=obj_threshold,
-                          nms_threshold=nms_threshold
-                          )
+        for idx, image, boxes in zip(batch, images, predict_batch(images, model, batch_size=batch_size, **config)):
+            results[idx] = (boxes, image.shape[:2])
 
-    bouding_boxes = get_bounding_boxes(image, boxes, grid_h, grid_w)
+            if cache is not None:
+                cache.put(keys[idx], boxes, image.shape[:2])
 
-    return bouding_boxes
+    return results
+
+
+def prediction_config(**kwargs):
+    parameters = inspect.signature(predict_batch).parameters
+    config = {name: parameter.default for name, parameter in parameters.items()
+              if name not in ('images', 'model', 'batch_size')}
+    config.update(kwargs)
+
+    if config['anchors'] is None:
+        config['anchors'] = ANCHORS
+
+    return config
+
+
+def preprocess_image(image, image_width=416, image_height=416, normalize=True):
+    import cv2
+
+    input_image = cv2.resize(image, (image_height, image_width))
+    return input_image / 255. if normalize else input_image
 
 
 def load_image(image_path):
     return np.array(Image.open(image_path))
 
 
-def decode_netout(netout, shape_dims, anchors, nb_class, obj_threshold=0.3, nms_threshold=0.3):
-    netout = np.reshape(netout, shape_dims)
-    grid_h, grid_w, nb_box = netout.shape[:3]
+def decode_candidates(netout, shape_dims, anchors, obj_threshold=0.3):
+    _, boxes, confidences, classes = _decode_batch_candidates(netout, shape_dims, anchors, obj_threshold)
+
+    return boxes, confidences, classes
+
+
+def _decode_batch_candidates(netouts, shape_dims, anchors, obj_threshold):
+    # Decode every (image, row, col, anchor) cell at once and keep the cells with a class score above threshold.
+    # Boxes are (xmin, ymin, xmax, ymax) in grid units, ordered image -> row -> col -> anchor like the cell loop was.
+    # Scores stay in the netout dtype like the in place arrays of the loop, box coordinates are float64 like its
+    # scalar arithmetic (NumPy 1.x promoted it), so truncated pixel coordinates come out the same.
+    netouts = np.reshape(netouts, (-1,) + tuple(shape_dims))
+    dtype = np.float64
+
+    confidence = sigmoid(netouts[..., 4])
+    classes = confidence[..., np.newaxis] * sigmoid(netouts[..., 5:])
+    classes *= classes > obj_threshold
+
+    image_idx, rows, cols, anchor_idx = np.nonzero(np.sum(classes, axis=-1) > 0)
+    candidates = netouts[image_idx, rows, cols, anchor_idx].astype(dtype)
+    anchors = np.reshape(np.asarray(anchors, dtype=dtype), (-1, 2))
+
+    x = cols.astype(dtype) + sigmoid(candidates[:, 0])
+    y = rows.astype(dtype) + sigmoid(candidates[:, 1])
+    w = anchors[anchor_idx, 0] * np.exp(candidates[:, 2])
+    h = anchors[anchor_idx, 1] * np.exp(candidates[:, 3])
 
-    boxes = []
+    boxes = np.stack([x - w / 2, y - h / 2, x + w / 2, y + h / 2], axis=-1)
+    cells = (image_idx, rows, cols, anchor_idx)
 
-    netout[..., 4] = sigmoid(netout[..., 4])
-    netout[..., 5] = netout[..., 4] * sigmoid(netout[..., 5])
-    netout[..., 5] *= netout[..., 5] > obj_threshold
+    return image_idx, boxes, confidence[cells], classes[cells]
 
-    for row in range(grid_h):
-        for col in range(grid_w):
-            for b in range(nb_box):
 
-                classes = netout[row, col, b, 5:]
+def decode_netout_batch(netouts, shape_dims, anchors, nb_class, obj_threshold=0.3, nms_threshold=0.3,
+                        max_detections=None):
+    image_idx, boxes, confidences, classes = _decode_batch_candidates(netouts, shape_dims, anchors, obj_threshold)
+    nb_image = np.size(netouts) // np.prod(shape_dims)
+    bounds = np.searchsorted(image_idx, np.arange(nb_image + 1))
 
-                if np.sum(classes) > 0:
-                    x, y, w, h, confidence = netout[row, col, b, :5]
+    decoded = []
 
-                    x = (col + sigmoid(x))
-                    y = (row + sigmoid(y))
-                    w = anchors[2 * b + 0] * np.exp(w)
-                    h = anchors[2 * b + 1] * np.exp(h)
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        image_boxes, _, image_classes = _suppress(boxes[start:end], confidences[start:end], classes[start:end],
+                                                  nms_threshold, max_detections)
+        class_ids = np.argmax(image_classes, axis=-1)
+        decoded.append((image_boxes, image_classes[np.arange(len(image_classes)), class_ids], class_ids))
 
-                    box = BoundBox(x - w / 2, y - h / 2, x + w / 2, y + h / 2, confidence, classes)
+    return decoded
 
-                    boxes.append(box)
 
-    for c in range(nb_class):
-        sorted_indices = list(reversed(np.argsort([box.classes[c] for box in boxes])))
+def decode_netout_arrays(netout, shape_dims, anchors, nb_class, obj_threshold=0.3, nms_threshold=0.3,
+                         max_detections=None):
+    return decode_netout_batch(netout, shape_dims, anchors, nb_class, obj_threshold, nms_threshold,
+                               max_detections)[0]
 
-        for i in range(len(sorted_indices)):
-            index_i = sorted_indices[i]
 
-            if boxes[index_i].classes[c] == 0:
-                continue
-            else:
-                for j in range(i + 1, len(sorted_indices)):
-                    index_j = sorted_indices[j]
+def decode_netout(netout, shape_dims, anchors, nb_class, obj_threshold=0.3, nms_threshold=0.3, max_detections=None):
+    boxes, confidences, classes = _suppress(*decode_candidates(netout, shape_dims, anchors, obj_threshold),
+                                            nms_threshold, max_detections)
 
-                    if bbox_iou(boxes[index_i], boxes[index_j]) >= nms_threshold:
-                        boxes[index_j].classes[c] = 0
+    return [BoundBox(*box, confidence, box_classes) for box, confidence, box_classes in zip(boxes, confidences, classes)]
 
-    boxes = [box for box in boxes if box.get_score() > 0]
 
-    return boxes
+def _suppress(boxes, confidences, classes, nms_threshold, max_detections):
+    # Every (box, class) pair with a non-zero score takes part in NMS on its own, like the per-class loop did.
+    box_idx, class_idx = np.nonzero(classes > 0)
+    kept = non_max_suppression(boxes[box_idx],
+                               classes[box_idx, class_idx],
+                               iou_threshold=nms_threshold,
+                               class_ids=class_idx,
+                               max_detections=max_detections)
+
+    kept_classes = np.zeros_like(classes)
+    kept_classes[box_idx[kept], class_idx[kept]] = classes[box_idx[kept], class_idx[kept]]
+    keep = np.any(kept_classes > 0, axis=-1)
+
+    return boxes[keep], confidences[keep], kept_classes[keep]
 
 
 def get_bounding_boxes(image, boxes, grid_h, grid_w):
-    image_h, image_w, _ = image.shape
-    box_list = []
+    image_h, image_w = image.shape[:2]
 
-    for box in boxes:
-        xmin = max(int(box.xmin * image_w / grid_w), 0)
-        ymin = max(int(box.ymin * image_h / grid_h), 0)
-        xmax = min(int(box.xmax * image_w / grid_w), image_w)
-        ymax = min(int(box.ymax * image_h / grid_h), image_h)
+    if not isinstance(boxes, np.ndarray):
+        boxes = np.array([[box.xmin, box.ymin, box.xmax, box.ymax] for box in boxes])
+    boxes = np.reshape(boxes, (-1, 4))
 
-        box_list.append([xmin, ymin, xmax-xmin, ymax-ymin])
+    xmin = np.maximum((boxes[:, 0] * image_w / grid_w).astype(int), 0)
+    ymin = np.maximum((boxes[:, 1] * image_h / grid_h).astype(int), 0)
+    xmax = np.minimum((boxes[:, 2] * image_w / grid_w).astype(int), image_w)
+    ymax = np.minimum((boxes[:, 3] * image_h / grid_h).astype(int), image_h)
 
-    return box_list
+    return np.stack([xmin, ymin, xmax - xmin, ymax - ymin], axis=-1).tolist()
 
 
 def sigmoid(x):
@@ -250,8 +421,11 @@ def interval_overlap(interval_a, interval_b):
 #################################
 
 
-def dataset_check(image_dir, xml_dir, labels, name):
-
+def dataset_check(image_dir, xml_dir, labels, name, workers=1, use_index=False, sheet_size=None,
+                  thumbnail_size=(320, 240), max_in_flight=None):
+    # workers > 1 renders in a process pool with at most max_in_flight images queued (2 per worker by default).
+    # With sheet_size, downscaled (width, height) thumbnails are written sheet_size per contact sheet instead of
+    # one full size copy per image.
     if not os.path.exists(image_dir):
         raise FileNotFoundError('{} is not exists'.format(image_dir))
 
@@ -261,76 +435,142 @@ def dataset_check(image_dir, xml_dir, labels, name):
     os.makedirs('./dataset_check', exist_ok=True)
     print('Start check {} dataset'.format(name))
 
-    instances, _ = parse_annotation(xml_dir, image_dir, labels, name)
-    idx = 0
-    for instance in tqdm(instances, desc='Check {} dataset'.format(name)):
-        idx += 1
+    if use_index:
+        instances, _ = parse_annotation(xml_dir, image_dir, labels, name, workers=workers, use_index=True)
+    else:
+        # Rendering starts on the first parsed file, the render pool is the one using the workers
+        instances = iter_annotations(xml_dir, image_dir, labels)
+
+    if sheet_size is None:
+        output_paths = ('./dataset_check/{}.jpg'.format(idx) for idx in count(1))
+        results = map_bounded(render_check_image, instances, output_paths,
+                              workers=workers, max_in_flight=max_in_flight)
+
+        for _ in tqdm(results, desc='Check {} dataset'.format(name)):
+            pass
+    else:
+        render = partial(render_check_thumbnail, thumbnail_size=thumbnail_size)
+        results = map_bounded(render, instances, workers=workers, max_in_flight=max_in_flight)
+        thumbnails = []
+        page = 0
 
-        image_path = instance['filename']
-        image = load_image(image_path)
+        for thumbnail in tqdm(results, desc='Check {} dataset'.format(name)):
+            thumbnails.append(thumbnail)
 
-        for object in instance['object']:
-            cv2.rectangle(image, (object['xmin'], object['ymin']), (object['xmax'], object['ymax']), (0, 255, 0), 2)
-            cv2.putText(image,
-                        object['name'],
-                        (object['xmin'], object['ymin'] - 5),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        1e-3 * image.shape[0],
-                        (0, 255, 0), 1)
+            if len(thumbnails) == sheet_size:
+                page += 1
+                save_contact_sheet(thumbnails, sheet_size, thumbnail_size, './dataset_check/sheet_{}.jpg'.format(page))
+                thumbnails = []
 
-        Image.fromarray(image).save('./dataset_check/{}.jpg'.format(idx))
+        if len(thumbnails) > 0:
+            save_contact_sheet(thumbnails, sheet_size, thumbnail_size, './dataset_check/sheet_{}.jpg'.format(page + 1))
 
     print('End check {} dataset!'.format(name))
 
 
-def parse_annotation(ann_dir, img_dir, labels, data_name):
+def map_bounded(function, *iterables, workers=1, max_in_flight=None, initializer=None, initargs=()):
+    # Like map, in a process pool when workers != 1, but never more than max_in_flight calls are submitted ahead
+    # of the result being consumed, so that big inputs or outputs do not pile up in memory.
+    # initializer(*initargs) runs once per worker process, or once in this process when workers == 1.
+    if workers == 1:
+        if initializer is not None:
+            initializer(*initargs)
+
+        yield from map(function, *iterables)
+        return
+
+    if max_in_flight is None:
+        max_in_flight = 2 * (workers or os.cpu_count())
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        pending = deque()
+
+        for args in zip(*iterables):
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+            pending.append(executor.submit(function, *args))
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def draw_objects(image, objects, scale=1.0):
+    import cv2
+
+    for object in objects:
+        xmin, ymin = int(object['xmin'] * scale), int(object['ymin'] * scale)
+        xmax, ymax = int(object['xmax'] * scale), int(object['ymax'] * scale)
+
+        cv2.rectangle(image, (xmin, ymin), (xmax, ymax), (0, 255, 0), 2)
+        cv2.putText(image,
+                    object['name'],
+                    (xmin, ymin - 5),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    1e-3 * image.shape[0],
+                    (0, 255, 0), 1)
+
+    return image
+
+
+def render_check_image(instance, output_path):
+    image = load_image(instance['filename'])
+    Image.fromarray(draw_objects(image, instance['object'])).save(output_path)
+
+
+def render_check_thumbnail(instance, thumbnail_size):
+    # JPEGs are decoded at a reduced DCT scale close to the thumbnail size instead of at full resolution
+    image = Image.open(instance['filename'])
+    width, height = image.size
+    image.draft('RGB', thumbnail_size)
+
+    scale = min(thumbnail_size[0] / width, thumbnail_size[1] / height)
+    image = image.convert('RGB').resize((max(1, int(width * scale)), max(1, int(height * scale))), Image.BILINEAR)
+
+    return draw_objects(np.array(image), instance['object'], scale)
+
+
+def save_contact_sheet(thumbnails, sheet_size, thumbnail_size, output_path):
+    thumbnail_w, thumbnail_h = thumbnail_size
+    columns = int(np.ceil(np.sqrt(sheet_size)))
+    rows = int(np.ceil(len(thumbnails) / columns))
+
+    sheet = np.zeros((rows * thumbnail_h, columns * thumbnail_w, 3), dtype=np.uint8)
+
+    for idx, thumbnail in enumerate(thumbnails):
+        y, x = (idx // columns) * thumbnail_h, (idx % columns) * thumbnail_w
+        sheet[y:y + thumbnail.shape[0], x:x + thumbnail.shape[1]] = thumbnail
+
+    Image.fromarray(sheet).save(output_path)
+
+
+def parse_annotation(ann_dir, img_dir, labels, data_name, workers=1, chunksize=64, use_index=False):
+    # workers > 1 (or None for every core) spreads the files over a process pool, results keep the sorted file order.
+    # use_index loads from the AnnotationIndex next to ann_dir and only re-parses the files changed since last time.
     if len(labels) == 0:
         raise ValueError("given label is not valid")
 
     print("Start Parsing {} data annotions...".format(data_name))
 
+    if use_index:
+        from annotation_index import AnnotationIndex
+
+        index = AnnotationIndex(ann_dir)
+        index.refresh(workers=workers, chunksize=chunksize)
+        all_imgs, seen_labels = index.records(img_dir, labels), index.seen_labels()
+
+        print("End Parsing Annotations!")
+
+        return all_imgs, seen_labels
+
     all_imgs = []
     seen_labels = {}
 
-    for ann in tqdm(sorted(os.listdir(ann_dir)), desc="Parse {} annotations".format(data_name)):
-        img = {"object": []}
-
-        tree = ET.parse(os.path.join(ann_dir, ann))
-
-        for elem in tree.iter():
-            if "filename" in elem.tag:
-                img["filename"] = os.path.join(img_dir, elem.text)
-            if "width" in elem.tag:
-                img["width"] = int(elem.text)
-            if "height" in elem.tag:
-                img["height"] = int(elem.text)
-            if "object" in elem.tag or "part" in elem.tag:
-                obj = {}
-
-                for attr in list(elem):
-                    if "name" in attr.tag:
-                        obj["name"] = attr.text
-
-                        if obj["name"] in seen_labels:
-                            seen_labels[obj["name"]] += 1
-                        else:
-                            seen_labels[obj["name"]] = 1
-
-                        if len(labels) > 0 and obj["name"] not in labels:
-                            break
-                        else:
-                            img["object"] += [obj]
-
-                    if "bndbox" in attr.tag:
-                        for dim in list(attr):
-                            if "xmin" in dim.tag:
-                                obj["xmin"] = int(round(float(dim.text)))
-                            if "ymin" in dim.tag:
-                                obj["ymin"] = int(round(float(dim.text)))
-                            if "xmax" in dim.tag:
-                                obj["xmax"] = int(round(float(dim.text)))
-                            if "ymax" in dim.tag:
-                                obj["ymax"] = int(round(float(dim.text)))
+    ann_paths = [os.path.join(ann_dir, ann) for ann in sorted(os.listdir(ann_dir))]
+    results = parse_annotation_files(ann_paths, img_dir, labels, workers, chunksize)
+
+    for img, names in tqdm(results, total=len(ann_paths), desc="Parse {} annotations".format(data_name)):
+        for name in names:
+            seen_labels[name] = seen_labels.get(name, 0) + 1
 
         if len(img["object"]) > 0:
             all_imgs += [img]
@@ -340,6 +580,142 @@ def parse_annotation(ann_dir, img_dir, labels, data_name):
     return all_imgs, seen_labels
 
 
+def parse_annotation_files(ann_paths, img_dir, labels, workers=1, chunksize=64):
+    # Yields parse_annotation_file results in the order of ann_paths
+    parse = partial(parse_annotation_file, img_dir=img_dir, labels=labels)
+
+    if workers == 1:
+        yield from map(parse, ann_paths)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(parse, ann_paths, chunksize=chunksize)
+
+
+def parse_annotation_file(ann_path, img_dir, labels):
+    # Returns (image record, every object name in document order). Keeps the substring tag matching of the
+    # original ElementTree walk so that the records are identical, but parses with lxml and skips comments.
+    from lxml import etree
+
+    img = {"object": []}
+    names = []
+
+    tree = etree.parse(ann_path)
+
+    for elem in tree.iter(etree.Element):
+        if "filename" in elem.tag:
+            img["filename"] = os.path.join(img_dir, elem.text)
+        if "width" in elem.tag:
+            img["width"] = int(elem.text)
+        if "height" in elem.tag:
+            img["height"] = int(elem.text)
+        if "object" in elem.tag or "part" in elem.tag:
+            obj = {}
+
+            for attr in elem.iterchildren(etree.Element):
+                if "name" in attr.tag:
+                    obj["name"] = attr.text
+                    names.append(obj["name"])
+
+                    if len(labels) > 0 and obj["name"] not in labels:
+                        break
+                    else:
+                        img["object"] += [obj]
+
+                if "bndbox" in attr.tag:
+                    for dim in attr.iterchildren(etree.Element):
+                        if "xmin" in dim.tag:
+                            obj["xmin"] = int(round(float(dim.text)))
+                        if "ymin" in dim.tag:
+                            obj["ymin"] = int(round(float(dim.text)))
+                        if "xmax" in dim.tag:
+                            obj["xmax"] = int(round(float(dim.text)))
+                        if "ymax" in dim.tag:
+                            obj["ymax"] = int(round(float(dim.text)))
+
+    return img, names
+
+
+def iter_annotations(ann_dir, img_dir, labels, min_size=0, workers=1, max_in_flight=None):
+    # Yields one image record at a time, in sorted file order, with the same layout as parse_annotation.
+    # Objects whose name is not in labels or whose box is narrower or lower than min_size pixels are dropped
+    # while parsing, and images left without objects are never yielded.
+    if len(labels) == 0:
+        raise ValueError("given label is not valid")
+
+    ann_paths = (os.path.join(ann_dir, ann) for ann in sorted(os.listdir(ann_dir)))
+    parse = partial(parse_filtered_annotation_file, img_dir=img_dir, labels=frozenset(labels), min_size=min_size)
+
+    for img in map_bounded(parse, ann_paths, workers=workers, max_in_flight=max_in_flight):
+        if img is not None:
+            yield img
+
+
+def parse_filtered_annotation_file(ann_path, img_dir, labels, min_size=0):
+    # Incremental lxml parse: every object is filtered as soon as its end tag is read and then cleared.
+    # Objects keep their document order, nested parts included, through a slot taken at their start tag.
+    from lxml import etree
+
+    img = {}
+    slots = []
+    open_slots = []
+
+    for event, elem in etree.iterparse(ann_path, events=('start', 'end')):
+        is_object = "object" in elem.tag or "part" in elem.tag
+
+        if event == 'start':
+            if is_object:
+                open_slots.append(len(slots))
+                slots.append(None)
+            continue
+
+        if "filename" in elem.tag:
+            img["filename"] = os.path.join(img_dir, elem.text)
+        if "width" in elem.tag:
+            img["width"] = int(elem.text)
+        if "height" in elem.tag:
+            img["height"] = int(elem.text)
+        if is_object:
+            slots[open_slots.pop()] = _filtered_object(elem, labels, min_size)
+            elem.clear()
+
+    objects = [obj for obj in slots if obj is not None]
+
+    if len(objects) == 0:
+        return None
+
+    return {"object": objects, **img}
+
+
+def _filtered_object(elem, labels, min_size):
+    from lxml import etree
+
+    obj = {}
+
+    for attr in elem.iterchildren(etree.Element):
+        if "name" in attr.tag:
+            if attr.text not in labels:
+                return None
+            obj["name"] = attr.text
+
+        if "bndbox" in attr.tag:
+            for dim in attr.iterchildren(etree.Element):
+                for key in ("xmin", "ymin", "xmax", "ymax"):
+                    if key in dim.tag:
+                        obj[key] = int(round(float(dim.text)))
+
+    if "name" not in obj:
+        return None
+
+    if min_size > 0:
+        if not all(key in obj for key in ("xmin", "ymin", "xmax", "ymax")):
+            return None
+        if obj["xmax"] - obj["xmin"] < min_size or obj["ymax"] - obj["ymin"] < min_size:
+            return None
+
+    return obj
+
+
 if __name__ == '__main__':
     dataset_check('./MVI_0788_VIS_OB/image',
                   './MVI_0788_VIS_OB/annotation',